@@ -0,0 +1 @@
+# bench: бенчмарки и нагрузочные тесты портала на синтетических данных (без Google)
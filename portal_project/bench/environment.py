@@ -0,0 +1,46 @@
+# bench/environment.py
+import os
+import shutil
+import tempfile
+
+import streamlit as st
+from streamlit import config as st_config
+from streamlit.logger import set_log_level
+
+import snapshot_store
+import utils
+from bench.fake_sheets import FakeSpreadsheet
+from bench.synthetic import to_toml
+
+
+class BenchEnvironment:
+    """
+    Портал без Google: листы в FakeSpreadsheet, secrets во временном secrets.toml,
+    снимки — во временной папке. Один объект на запуск бенчмарка или нагрузочного теста.
+    """
+
+    def __init__(self, sheets, secrets, latency=0.0):
+        self.workdir = tempfile.mkdtemp(prefix="portal-bench-")
+        self.secrets = secrets
+        secrets_path = os.path.join(self.workdir, "secrets.toml")
+        with open(secrets_path, "w", encoding="utf-8") as f:
+            f.write(to_toml(secrets))
+        # Без сервера Streamlit пишет предупреждения на каждый вызов кэша и st.* — в замерах они не нужны
+        set_log_level("error")
+        st_config.set_option("secrets.files", [secrets_path])
+        # secrets читаются один раз на процесс: сбрасываем, чтобы следующее окружение увидело свой файл
+        st.secrets._reset()
+        snapshot_store.SNAPSHOT_DIR = os.path.join(self.workdir, "snapshots")
+        self.spreadsheet = FakeSpreadsheet(sheets, latency=latency)
+        utils.use_spreadsheet(self.spreadsheet)
+
+    def reset(self):
+        """Холодный старт: без снимков на диске и без кэшей процесса."""
+        shutil.rmtree(snapshot_store.SNAPSHOT_DIR, ignore_errors=True)
+        st.cache_data.clear()
+        st.cache_resource.clear()
+        self.spreadsheet.reset_calls()
+
+    def close(self):
+        utils.use_spreadsheet(None)
+        shutil.rmtree(self.workdir, ignore_errors=True)
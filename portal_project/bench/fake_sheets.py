@@ -0,0 +1,131 @@
+# bench/fake_sheets.py
+import re
+import time
+import threading
+from collections import Counter
+
+import gspread
+from gspread.utils import a1_to_rowcol
+
+# 'Лист'!1:5000 или просто 'Лист' (как их строит utils._a1_sheet_range)
+_SHEET_RANGE = re.compile(r"^'((?:[^']|'')*)'(?:!(\d+):(\d+))?$")
+_ROW_RANGE = re.compile(r"^(\d+):(\d+)$")
+_COLUMN_RANGE = re.compile(r"^([A-Z]+):([A-Z]+)$")
+
+
+def _trim(rows):
+    """Google не отдает пустые строки в конце диапазона."""
+    rows = [list(row) for row in rows]
+    while rows and not any(rows[-1]):
+        rows.pop()
+    return rows
+
+
+class FakeWorksheet:
+    """Лист в памяти с теми методами gspread.Worksheet, которыми пользуется портал."""
+
+    def __init__(self, spreadsheet, title, values):
+        self._spreadsheet = spreadsheet
+        self.title = title
+        self._values = [list(row) for row in values]
+
+    @property
+    def row_count(self):
+        return len(self._values)
+
+    @property
+    def col_count(self):
+        return max((len(row) for row in self._values), default=0)
+
+    def _cell(self, row, col):
+        if row <= len(self._values) and col <= len(self._values[row - 1]):
+            return self._values[row - 1][col - 1]
+        return ""
+
+    def _read(self, a1_range):
+        """Значения диапазона: строки '1:1', колонки 'C:C' или одна ячейка 'B5'."""
+        match = _ROW_RANGE.match(a1_range)
+        if match:
+            start, end = int(match.group(1)), int(match.group(2))
+            return _trim(self._values[start - 1:end])
+        match = _COLUMN_RANGE.match(a1_range)
+        if match:
+            col = a1_to_rowcol(f"{match.group(1)}1")[1]
+            return _trim([[self._cell(row, col)] if self._cell(row, col) else [] for row in range(1, len(self._values) + 1)])
+        row, col = a1_to_rowcol(a1_range)
+        value = self._cell(row, col)
+        return [[value]] if value else []
+
+    def get_all_values(self):
+        self._spreadsheet._record("get_all_values")
+        return _trim(self._values)
+
+    def row_values(self, row):
+        self._spreadsheet._record("row_values")
+        return list(self._values[row - 1]) if row <= len(self._values) else []
+
+    def batch_get(self, ranges):
+        self._spreadsheet._record("batch_get")
+        return [self._read(a1_range) for a1_range in ranges]
+
+    def batch_update(self, updates):
+        self._spreadsheet._record("batch_update")
+        with self._spreadsheet._lock:
+            for update in updates:
+                row, col = a1_to_rowcol(update["range"])
+                while len(self._values) < row:
+                    self._values.append([])
+                cells = self._values[row - 1]
+                cells.extend([""] * (col - len(cells)))
+                cells[col - 1] = update["values"][0][0]
+
+
+class FakeSpreadsheet:
+    """
+    Google-таблица в памяти для бенчмарков и нагрузочных тестов.
+    latency — задержка каждого запроса (секунд), как у сетевого вызова; calls — счетчик запросов по методам.
+    """
+
+    def __init__(self, sheets, latency=0.0, spreadsheet_id="bench"):
+        self.id = spreadsheet_id
+        self.latency = latency
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._worksheets = {title: FakeWorksheet(self, title, values) for title, values in sheets.items()}
+
+    def _record(self, method):
+        with self._lock:
+            self.calls[method] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls.clear()
+
+    def worksheet(self, title):
+        self._record("worksheet")
+        if title not in self._worksheets:
+            raise gspread.exceptions.WorksheetNotFound(title)
+        return self._worksheets[title]
+
+    def _value_range(self, a1_range):
+        match = _SHEET_RANGE.match(a1_range)
+        if match is None:
+            raise ValueError(f"Unsupported range: {a1_range}")
+        title = match.group(1).replace("''", "'")
+        if title not in self._worksheets:
+            # Так же, как Google: весь batch-запрос падает, если одного листа нет
+            raise gspread.exceptions.WorksheetNotFound(title)
+        values = self._worksheets[title]._values
+        if match.group(2):
+            values = values[int(match.group(2)) - 1:int(match.group(3))]
+        return {"range": a1_range, "majorDimension": "ROWS", "values": _trim(values)}
+
+    def values_get(self, a1_range):
+        self._record("values_get")
+        return self._value_range(a1_range)
+
+    def values_batch_get(self, ranges):
+        self._record("values_batch_get")
+        return {"spreadsheetId": self.id, "valueRanges": [self._value_range(a1_range) for a1_range in ranges]}
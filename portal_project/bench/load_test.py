@@ -0,0 +1,319 @@
+# bench/load_test.py
+"""
+Нагрузочный тест страниц: N одновременных сессий (как продавцы в 9 утра) через Streamlit AppTest
+против FakeSpreadsheet. Кэши, снимки и фоновые потоки общие для всех сессий, как на одном сервере.
+
+AppTest на время прогона подменяет глобальное состояние Streamlit (Runtime, st.secrets, PagesManager),
+поэтому прогоны скриптов сессий идут по одному под блокировкой, а сессии чередуются между собой.
+В замер перезапуска входит только сам прогон; ожидание своей очереди считается отдельно.
+
+Запуск из папки portal_project:
+    python -m bench.load_test --sessions 20 --rows 10000
+    python -m bench.load_test --sessions 50 --ramp 10 --latency 0.3 --json load.json
+
+Каждая сессия входит на portal.py, выбирает компанию и проигрывает сценарий своей роли
+(поиск с набором по буквам, выбор команды и участника, месяц бонусов, «✅ Noted»).
+Отчет: p50/p95/p99 времени перезапуска скрипта по страницам и действиям, число запросов к таблице
+и шаги сценариев, которые не удалось проиграть (нет виджета). Код выхода 1, если хоть одна сессия упала.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest, app_test, local_script_runner
+
+import metrics
+import utils
+from bench.environment import BenchEnvironment
+from bench.synthetic import COMPANIES, generate_sheets, bench_secrets, sales_reps
+
+PORTAL_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "bench"
+# Доля ролей среди сессий: в основном продавцы. Роли чередуются, чтобы и короткий прогон (от 4 сессий)
+# проходил все сценарии
+ROLE_MIX = ["rep", "team_lead", "director", "admin", "rep", "rep", "team_lead", "rep", "rep", "rep"]
+SEARCH_TEXT = "ocean"
+
+# Сценарии ролей: ("open", страница) | ("type", начало подписи, текст) | ("select", начало подписи, номер варианта)
+# | ("click", подпись кнопки). Ввод текста проигрывается по буквам — каждая буква дает перезапуск.
+SCENARIOS = {
+    "rep": [
+        ("open", "pages/1_Overdue.py"), ("type", "Search by", SEARCH_TEXT),
+        ("open", "pages/2_Customers.py"), ("type", "Search by", SEARCH_TEXT), ("select", "Filter by", 1),
+        ("open", "pages/6_Notifications.py"), ("click", "✅ Noted"),
+    ],
+    "team_lead": [
+        ("open", "pages/4_Team.py"), ("select", "Filter by Team Member", 1),
+        ("open", "pages/1_Overdue.py"), ("type", "Search by", SEARCH_TEXT),
+    ],
+    # Директор видит только свои команды: выбор команды («Filter by Team:») есть лишь у полного доступа
+    "director": [
+        ("open", "pages/4_Team.py"), ("select", "Filter by Team Member", 1),
+        ("open", "pages/3_Bonus.py"), ("select", "Month", 1),
+    ],
+    "admin": [
+        ("open", "pages/1_Overdue.py"), ("type", "Search by", SEARCH_TEXT),
+        ("open", "pages/4_Team.py"), ("select", "Filter by Team:", 1),
+        ("open", "pages/3_Bonus.py"), ("select", "Month", 1),
+        ("open", "pages/6_Notifications.py"), ("click", "✅ Noted"),
+    ],
+}
+
+
+# Один прогон AppTest за раз: прогон ставит и сбрасывает глобальные Runtime, st.secrets и PagesManager
+_run_lock = threading.Lock()
+# Что из-за этого не измеряется — печатается в отчете рядом с цифрами
+SERIAL_RUNS_NOTE = ("Script reruns are serialised behind one lock (AppTest shares global Streamlit state), so sessions "
+                    "never overlap: the numbers are per-rerun latency on shared caches and snapshots, not coalescing "
+                    "or quota contention between concurrent reruns. Only background threads (refresh, chunked reads, "
+                    "ack writes) run concurrently with a rerun.")
+
+
+def share_script_cache():
+    """
+    AppTest на каждом прогоне заново компилирует скрипт; настоящий сервер держит байткод в кэше.
+    Общий кэш убирает компиляцию из замеров.
+    """
+    shared_cache = ScriptCache()
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: shared_cache
+
+
+def role_users():
+    """Логины для ролей по структуре bench_secrets: тимлиды — первые в десятке, директор — последний."""
+    logins = [login for _, login in sales_reps()]
+    leads = logins[0::10]
+    return {
+        "admin": ["admin"],
+        "director": [logins[-1]],
+        "team_lead": leads,
+        "rep": [login for login in logins[:-1] if login not in leads],
+    }
+
+
+def _widget(elements, label_prefix):
+    matched = [element for element in elements if element.label.startswith(label_prefix)]
+    return matched[0] if matched else None
+
+
+class Session:
+    """Одна пользовательская сессия: AppTest и замеры каждого перезапуска."""
+
+    def __init__(self, number, role, username, company_key, timeout):
+        self.number, self.role, self.username, self.company_key = number, role, username, company_key
+        self.at = AppTest.from_file(os.path.join(PORTAL_DIR, "portal.py"), default_timeout=timeout)
+        self.page = "portal"
+        self.samples = []
+        # Сколько ждали своей очереди на прогон (в замеры перезапусков не входит)
+        self.waits = []
+        self.errors = []
+        # Шаги сценария, для которых на странице не нашлось виджета
+        self.skipped = []
+
+    def rerun(self, action, interact=None):
+        """Действие пользователя и перезапуск скрипта; время перезапуска попадает в замеры."""
+        queued = time.perf_counter()
+        with _run_lock:
+            started = time.perf_counter()
+            if interact is not None:
+                interact()
+            self.at.run()
+            finished = time.perf_counter()
+        self.waits.append(started - queued)
+        self.samples.append((self.role, self.page, action, finished - started))
+        if self.at.exception:
+            self.errors.append(f"{self.page} / {action}: {self.at.exception[0].message}")
+
+    def login(self):
+        self.rerun("open")
+        self.at.text_input[0].input(self.username)
+        self.at.text_input[1].input(PASSWORD)
+        self.rerun("login", self.at.button[0].click)
+        if not self.at.session_state["authenticated"]:
+            raise RuntimeError("login form submit did not sign in")
+        prefix = "btn_" if self.username == "admin" else "user_btn_"
+        self.rerun("pick company", self.at.button(key=f"{prefix}{self.company_key}").click)
+
+    def play(self, steps):
+        for step in steps:
+            kind = step[0]
+            if kind == "open":
+                self.page = os.path.splitext(os.path.basename(step[1]))[0]
+                self.at.switch_page(step[1])
+                self.rerun("open")
+            elif kind == "type":
+                _, label_prefix, text = step
+                for i in range(1, len(text) + 1):
+                    widget = _widget(self.at.text_input, label_prefix)
+                    if widget is None:
+                        self.skip(step)
+                        break
+                    self.rerun("type", lambda: widget.input(text[:i]))
+            elif kind == "select":
+                _, label_prefix, option = step
+                widget = _widget(self.at.selectbox, label_prefix)
+                if widget is not None and len(widget.options) > option:
+                    self.rerun("select", lambda: widget.select_index(option))
+                else:
+                    self.skip(step)
+            elif kind == "click":
+                widget = _widget(self.at.button, step[1])
+                if widget is not None:
+                    self.rerun("click", widget.click)
+                else:
+                    self.skip(step)
+
+    def skip(self, step):
+        self.skipped.append(f"{self.role} {self.page}: {step[0]} '{step[1]}'")
+
+
+def run_session(session, delay=0.0):
+    time.sleep(delay)
+    try:
+        session.login()
+        session.play(SCENARIOS[session.role])
+    except Exception as e:
+        session.errors.append(f"{session.page}: {type(e).__name__}: {e}")
+
+
+def drain_acks(spreadsheet, timeout=30):
+    """Отметки «Noted» пишутся фоновой очередью: ждем, пока она опустеет, чтобы учесть и эти запросы."""
+    ack_queue = utils.get_ack_queue(spreadsheet)
+    deadline = time.time() + timeout
+    while ack_queue.pending_count() and time.time() < deadline:
+        time.sleep(0.5)
+
+
+def percentile(values, q):
+    """Перцентиль по ближайшему рангу (q от 0 до 100)."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(samples, group_index):
+    groups = defaultdict(list)
+    for sample in samples:
+        key = sample[group_index] if group_index is not None else "all"
+        groups[key].append(sample[3])
+    return {
+        key: {
+            "reruns": len(values),
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "mean_ms": statistics.fmean(values) * 1000,
+        }
+        for key, values in sorted(groups.items())
+    }
+
+
+def print_summary(title, summary):
+    print(f"\n{title}")
+    print(f"{'':<24} {'reruns':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean ms':>9}")
+    for key, row in summary.items():
+        print(f"{key:<24} {row['reruns']:>7} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f} "
+              f"{row['mean_ms']:>9.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent-session load test of the portal pages on synthetic sheets.")
+    parser.add_argument("--sessions", type=int, default=20, help="number of concurrent user sessions")
+    parser.add_argument("--rows", type=int, default=10_000, help="rows per synthetic sheet")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds over which sessions start (0 — all at once)")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated Google API latency, seconds per call")
+    parser.add_argument("--timeout", type=float, default=120.0, help="max seconds for a single rerun")
+    parser.add_argument("--no-warmup", action="store_true",
+                        help="skip the serial warm-up session per role (compiles page scripts before timing)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    secrets = bench_secrets(PASSWORD)
+    env = BenchEnvironment(generate_sheets(args.rows, seed=args.seed), secrets, latency=args.latency)
+    share_script_cache()
+    # Анимации страниц грузятся с внешнего CDN — к данным это не относится и только добавило бы сетевой шум
+    utils.load_lottieurl = lambda url: None
+
+    users = role_users()
+    company_keys = list(COMPANIES)
+    if not args.no_warmup:
+        # По одной сессии каждой роли подряд: компилируются скрипты страниц и шаблоны таблиц
+        for number, role in enumerate(SCENARIOS):
+            run_session(Session(number, role, users[role][0], company_keys[0], args.timeout))
+        drain_acks(env.spreadsheet)
+    # Замеры начинаются с холодного старта данных: без снимков и кэшей
+    env.reset()
+
+    sessions = []
+    for number in range(args.sessions):
+        role = ROLE_MIX[number % len(ROLE_MIX)]
+        username = users[role][number % len(users[role])]
+        sessions.append(Session(number, role, username, company_keys[number % len(company_keys)], args.timeout))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions, thread_name_prefix="session") as pool:
+        for session in sessions:
+            pool.submit(run_session, session, args.ramp * session.number / max(1, args.sessions))
+    wall_time = time.perf_counter() - started
+    drain_acks(env.spreadsheet)
+
+    samples = [sample for session in sessions for sample in session.samples]
+    waits = [wait for session in sessions for wait in session.waits]
+    errors = [f"session {session.number} ({session.role}): {error}" for session in sessions for error in session.errors]
+    skipped = Counter(step for session in sessions for step in session.skipped)
+    report = {
+        "sessions": args.sessions,
+        "rows": args.rows,
+        "note": SERIAL_RUNS_NOTE,
+        "wall_time_s": wall_time,
+        "overall": summarize(samples, None)["all"] if samples else {},
+        "by_page": summarize(samples, 1),
+        "by_action": summarize(samples, 2),
+        "by_role": summarize(samples, 0),
+        # Ожидание очереди на прогон AppTest (прогоны идут по одному), в замеры выше не входит
+        "run_queue_wait": summarize([(None, None, None, wait) for wait in waits], None)["all"] if waits else {},
+        "backend_calls": dict(sorted(env.spreadsheet.calls.items())),
+        # Загрузки листов, которые дождались уже идущей загрузки (single-flight), а не пошли в Google сами
+        "coalesced_loads": sum(value for (name, _), value in metrics.snapshot()[0].items()
+                               if name == "portal_fetch_coalesced_total"),
+        "skipped_steps": dict(skipped),
+        "errors": errors,
+    }
+
+    print(f"{args.sessions} sessions, {args.rows} rows per sheet, {len(samples)} reruns in {wall_time:.1f} s")
+    print(f"Note: {SERIAL_RUNS_NOTE}")
+    if samples:
+        print_summary("Overall", {"all": report["overall"]})
+        print_summary("By page", report["by_page"])
+        print_summary("By action", report["by_action"])
+        print_summary("By role", report["by_role"])
+        print_summary("Waiting for the AppTest run lock (not included above)", {"all": report["run_queue_wait"]})
+    print("\nBackend calls: " + ", ".join(f"{method}={count}" for method, count in report["backend_calls"].items()))
+    print(f"Coalesced sheet loads: {report['coalesced_loads']}")
+    if skipped:
+        # Шаг без виджета не проигран: в отчете нет его замеров (например, нет уведомлений для «✅ Noted»)
+        print("\nScenario steps not exercised (widget not found):")
+        for step, count in sorted(skipped.items()):
+            print(f"  {step} ×{count}")
+    if errors:
+        print(f"\n{len(errors)} errors:", file=sys.stderr)
+        for error in errors[:20]:
+            print(f"  {error}", file=sys.stderr)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    env.close()
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+# bench/run_bench.py
+"""
+Бенчмарк конвейера данных страниц на синтетических листах (без Google).
+
+Запуск из папки portal_project:
+    python -m bench.run_bench                      # 1k, 10k и 100k строк
+    python -m bench.run_bench --rows 10000 --repeat 5 --json bench.json
+
+Для каждой страницы замеряются шаги load -> sanitize -> filter -> search -> style
+(у уведомлений — load -> sanitize -> filter, как их выполняет pages/6_Notifications.py):
+холодный прогон (без снимков и кэшей), теплый (повторный вызов), пиковая память шага
+и число запросов к таблице.
+"""
+import argparse
+import json
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+
+import utils
+from bench.environment import BenchEnvironment
+from bench.synthetic import COMPANIES, generate_sheets, bench_secrets, sales_reps
+
+DEFAULT_ROWS = (1_000, 10_000, 100_000)
+PAGES = ("overdue", "customers", "bonuses", "notifications")
+# Правило подсветки и колонка для шага style (как на страницах)
+STYLE_RULES = {
+    "overdue": ("overdue_status", "status_col"),
+    "customers": ("customers_status", "status_col"),
+    "bonuses": ("bonus_result", "result_col"),
+}
+# Колонка поиска: на Bonus ищут по номеру отправки, на остальных — по клиенту
+SEARCH_COLUMNS = {"overdue": "customer_col", "customers": "customer_col", "bonuses": "shipment_col"}
+SEARCH_TERMS = {"bonuses": "SH00001"}
+DEFAULT_SEARCH_TERM = "ocean"
+
+
+def _notifications_filter(df, config, login):
+    """
+    Фильтр страницы уведомлений (pages/6_Notifications.py): имя продавца сравнивается без очистки
+    (strip_pattern=None), затем отметка «NotedBy» ищется по логину регулярным выражением.
+    """
+    df = utils.filter_by_sales(df, config["sales_col"], [login], strip_pattern=None).copy()
+    noted_by_pattern = rf"(?:^|,)\s*{re.escape(login)}\s*(?:,|$)"
+    df["is_noted_by_user"] = df[config["noted_by_col"]].fillna('').str.lower().str.contains(noted_by_pattern, regex=True)
+    return df
+
+
+def page_steps(page, config, login):
+    """Шаги страницы: [(имя, функция(предыдущий результат) -> результат)]."""
+    worksheet_name = config["worksheet"]
+    steps = [
+        ("load", lambda _: utils.load_data(utils.get_spreadsheet(), worksheet_name)),
+        ("sanitize", lambda df: utils.sanitize_columns(df)),
+    ]
+    if page == "notifications":
+        # Страница уведомлений не идет через load_page_frame и не ищет по клиенту
+        steps.append(("filter", lambda df: _notifications_filter(df, config, login)))
+        return steps
+
+    search_col = config.get(SEARCH_COLUMNS[page])
+    search_term = SEARCH_TERMS.get(page, DEFAULT_SEARCH_TERM)
+    steps += [
+        ("filter", lambda _: utils.load_page_frame(config, logins=[login])),
+        ("search", lambda _: utils.load_page_frame(config, logins=[login], search_col=search_col,
+                                                   search_term=search_term, fuzzy=True)),
+    ]
+    if page in STYLE_RULES:
+        rule_name, column_key = STYLE_RULES[page]
+        steps.append(("style", lambda df: utils.load_row_styles(df, rule_name, config.get(column_key))))
+    return steps
+
+
+def _run_steps(env, steps, trace_memory):
+    """Один холодный прогон шагов и сразу теплый; возвращает {шаг: (холодно, тепло, пик байт, запросов, строк)}."""
+    env.reset()
+    results = {}
+    value = None
+    for name, step in steps:
+        calls_before = sum(env.spreadsheet.calls.values())
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        cold_value = step(value)
+        cold = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+        started = time.perf_counter()
+        step(value)
+        warm = time.perf_counter() - started
+        results[name] = (cold, warm, peak, sum(env.spreadsheet.calls.values()) - calls_before, len(cold_value))
+        value = cold_value
+    return results
+
+
+def bench_page(env, page, company_key, login, repeat):
+    config = env.secrets["page_settings"][page][company_key]
+    steps = page_steps(page, config, login)
+    runs = [_run_steps(env, steps, trace_memory=False) for _ in range(repeat)]
+    # Отдельный прогон под tracemalloc: он замедляет код и исказил бы время
+    memory = _run_steps(env, steps, trace_memory=True)
+    rows = []
+    for name, _ in steps:
+        rows.append({
+            "page": page,
+            "step": name,
+            "cold_ms": statistics.median(run[name][0] for run in runs) * 1000,
+            "warm_ms": statistics.median(run[name][1] for run in runs) * 1000,
+            "peak_mb": memory[name][2] / 2 ** 20,
+            "api_calls": runs[0][name][3],
+            "rows_out": runs[0][name][4],
+        })
+    return rows
+
+
+def print_table(results):
+    header = (f"{'rows':>8} {'page':<14} {'step':<9} {'cold ms':>10} {'warm ms':>10} {'peak MB':>9} {'calls':>6} "
+              f"{'rows out':>9}")
+    print(header)
+    print("-" * len(header))
+    for row in results:
+        print(f"{row['rows']:>8} {row['page']:<14} {row['step']:<9} {row['cold_ms']:>10.1f} {row['warm_ms']:>10.2f} "
+              f"{row['peak_mb']:>9.1f} {row['api_calls']:>6} {row['rows_out']:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the portal data pipeline on synthetic sheets.")
+    parser.add_argument("--rows", type=int, nargs="+", default=list(DEFAULT_ROWS), help="sheet sizes to benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="cold runs per page (median is reported)")
+    parser.add_argument("--pages", nargs="+", choices=PAGES, default=list(PAGES))
+    parser.add_argument("--company", choices=list(COMPANIES), default="bench_us")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated Google API latency, seconds per call")
+    parser.add_argument("--chunk-rows", type=int, default=0,
+                        help="[refresher] chunk_rows; 0 reads every sheet in one request (deterministic timings)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write results to this JSON file")
+    args = parser.parse_args(argv)
+
+    # Логин продавца в том виде, в каком его передают страницы (без домена, точек и дефисов)
+    login = sales_reps()[0][1].split('@')[0].replace('.', '').replace('-', '')
+    secrets = bench_secrets()
+    secrets["refresher"] = {"interval_seconds": 0, "chunk_rows": args.chunk_rows}
+    results = []
+    for rows in args.rows:
+        env = BenchEnvironment(generate_sheets(rows, seed=args.seed), secrets, latency=args.latency)
+        try:
+            for page in args.pages:
+                for row in bench_page(env, page, args.company, login, args.repeat):
+                    results.append({"rows": rows, **row})
+                    print(f"  {rows} rows · {page} · {row['step']}: {row['cold_ms']:.1f} ms", file=sys.stderr)
+        finally:
+            env.close()
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+# bench/synthetic.py
+import json
+import random
+from datetime import date, timedelta
+
+# Две компании делят одни листы и различаются фильтром (как carolina_ff / carolina_ff_mex в secrets)
+COMPANIES = {"bench_us": "Bench Logistics US", "bench_mx": "Bench Logistics MX"}
+FIRST_NAMES = ["Anna", "Boris", "Carlos", "Diana", "Erik", "Fatima", "George", "Helen", "Ivan", "Julia",
+               "Kevin", "Laura", "Marat", "Nina", "Oscar", "Paula", "Ruslan", "Sofia", "Timur", "Vera"]
+LAST_NAMES = ["Smith", "Garcia", "Ivanova", "Lee", "Nurlanov", "Brown", "Lopez", "Kim", "Petrov", "Mendez"]
+NAME_WORDS = ["Blue", "Ocean", "Global", "Cargo", "Star", "Trans", "Pacific", "Delta", "Swift", "Prime",
+              "Atlas", "North", "Eagle", "Silver", "Bridge", "Harbor", "United", "Alpha", "Royal", "Metro"]
+NAME_SUFFIXES = ["LLC", "Inc", "Logistics", "Freight", "Shipping", "Group", "S.A. de C.V.", "Ltd"]
+STATUSES = ["ok"] * 12 + ["on hold", "blacklist", "claimed"]
+RESULTS = ["fine"] * 8 + ["error", "ops need to fix", "second part?"]
+PORTALS = ["WCA", "JCTrans", "Cnee"]
+
+
+def sales_reps(count=40):
+    """Продавцы: (полное имя, логин). Имена в листах пишутся по-разному, как у настоящих продавцов."""
+    reps = []
+    for i in range(count):
+        first, last = FIRST_NAMES[i % len(FIRST_NAMES)], LAST_NAMES[i // len(FIRST_NAMES) % len(LAST_NAMES)]
+        reps.append((f"{first} {last}", f"{first}.{last}@bench.example".lower()))
+    return reps
+
+
+def _customers(rng, count):
+    return [f"{rng.choice(NAME_WORDS)} {rng.choice(NAME_WORDS)} {rng.choice(NAME_SUFFIXES)} {i}" for i in range(count)]
+
+
+def _rep_spelling(rng, full_name):
+    """Одно из написаний продавца: 'Anna Smith', 'anna-smith', 'ANNA SMITH'."""
+    return rng.choice([full_name, full_name.lower().replace(" ", "-"), full_name.upper()])
+
+
+def generate_sheets(rows, seed=0):
+    """
+    Листы overdue/customers/bonuses/notifications по rows строк в формате get_all_values
+    (первая строка — заголовок, все значения — строки) и общий лист Notifications.
+    """
+    rng = random.Random(seed)
+    reps = sales_reps()
+    customers = _customers(rng, max(10, rows // 5))
+    today = date.today()
+
+    def row_common():
+        return rng.choice(customers), _rep_spelling(rng, rng.choice(reps)[0]), rng.choice(["US", "US", "MX"])
+
+    overdue = [["CUSTOMER NAME", "Sales", "Type", "TOTAL", "STATUS", "Invoice", "Due Date", "Days"]]
+    for i in range(rows):
+        customer, rep, division = row_common()
+        due = today - timedelta(days=rng.randint(1, 180))
+        overdue.append([customer, rep, division, f"${rng.randint(50, 250000):,}.{rng.randint(0, 99):02d}",
+                        rng.choice(STATUSES), f"INV-{i:07d}", due.strftime("%m/%d/%Y"), str((today - due).days)])
+
+    customers_sheet = [["Customer Name", "Sales representative", "Division", "Credit limit", "STATUS", "Payment Term",
+                        "WCA/JCTrans", "Membership Expiration date", "COUNTRY"]]
+    for i in range(rows):
+        customer, rep, division = row_common()
+        expires = today + timedelta(days=rng.randint(-60, 720))
+        customers_sheet.append([customer, rep, division, f"${rng.randint(1, 100) * 1000:,}", rng.choice(STATUSES),
+                                rng.choice(["NET 15", "NET 30", "NET 45", "Prepaid"]), rng.choice(PORTALS),
+                                expires.strftime("%m/%d/%Y"), rng.choice(["USA", "Mexico", "Canada", "Kazakhstan"])])
+
+    bonuses = [["Ship#", "Client", "Sales", "Type", "Month", "Year", "Result", "Σ Profit Bonus"]]
+    for i in range(rows):
+        customer, rep, division = row_common()
+        bonuses.append([f"SH{i:07d}", customer, rep, division, str(rng.randint(1, 12)),
+                        str(rng.choice([today.year - 1, today.year])), rng.choice(RESULTS), f"${rng.randint(5, 900)}.00"])
+
+    noti = [["WCA/JC Trans ID", "Клиент", "Портал", "Торговый представитель", "Дней до истечения",
+             "Дата истечения", "NotedBy"]]
+    for i in range(rows):
+        customer, rep, _ = row_common()
+        # Страница уведомлений ищет продавца по логину без точек и дефисов ('annasmith') без очистки ячейки,
+        # поэтому в этом листе имя пишется слитно
+        rep = rep.replace(" ", "").replace("-", "")
+        days_left = rng.randint(0, 30)
+        noti.append([f"ID{i:07d}", customer, rng.choice(PORTALS), rep, str(days_left),
+                     (today + timedelta(days=days_left)).strftime("%m/%d/%Y"), ""])
+
+    notifications = [["Username", "Status", "Message"]]
+    for i in range(rows):
+        login = rng.choice(reps)[1].split("@")[0]
+        notifications.append([login, rng.choice(["Unread", "Read", "Read"]), f"Membership expires soon ({i})"])
+
+    return {
+        "Overdue Bench": overdue,
+        "Customers Bench": customers_sheet,
+        "Bonuses Bench": bonuses,
+        "Noti Bench": noti,
+        "Notifications": notifications,
+    }
+
+
+def bench_secrets(password="bench"):
+    """
+    secrets для синтетических листов в той же структуре, что и .streamlit:
+    пользователи всех ролей (admin, директор, тимлид, продавец), команды и page_settings.
+    """
+    reps = sales_reps()
+    users = {"admin": {"password": password, "company": "admin"}}
+    for _, login in reps:
+        users[login] = {"password": password, "company": list(COMPANIES)}
+    teams, directors = {}, {}
+    for company_key in COMPANIES:
+        # Первый продавец десятки — тимлид этой десятки; последний продавец — директор двух первых команд
+        teams[company_key] = {reps[i][1]: [login for _, login in reps[i:i + 10]] for i in range(0, len(reps), 10)}
+        directors[company_key] = {reps[-1][1]: [reps[0][1], reps[10][1]]}
+
+    page_settings = {"overdue": {}, "customers": {}, "bonuses": {}, "notifications": {}}
+    for company_key, division_filter in (("bench_us", {"exclude_vals": ["MX"]}), ("bench_mx", {"filter_val": "MX"})):
+        page_settings["overdue"][company_key] = {
+            "worksheet": "Overdue Bench", "filter_col": "Type", **division_filter, "sales_col": "Sales",
+            "customer_col": "CUSTOMER NAME", "total_col": "TOTAL", "status_col": "STATUS",
+        }
+        page_settings["customers"][company_key] = {
+            "worksheet": "Customers Bench", "filter_col": "Division", **division_filter,
+            "sales_col": "Sales representative", "customer_col": "Customer Name", "status_col": "STATUS",
+            "summary_cols": ["Customer Name", "Credit limit", "STATUS", "Payment Term", "WCA/JCTrans",
+                             "Membership Expiration date", "COUNTRY", "Sales representative"],
+        }
+        page_settings["bonuses"][company_key] = {
+            "worksheet": "Bonuses Bench", "filter_col": "Type", **division_filter, "sales_col": "Sales",
+            "shipment_col": "Ship#", "month_col": "Month", "year_col": "Year", "result_col": "Result",
+            "summary_cols": ["Ship#", "Client", "Sales", "Result", "Σ Profit Bonus"],
+        }
+        page_settings["notifications"][company_key] = {
+            "worksheet": "Noti Bench", "sales_col": "Торговый представитель", "client_col": "Клиент",
+            "portal_col": "Портал", "days_left_col": "Дней до истечения", "expiry_date_col": "Дата истечения",
+            "id_col": "WCA/JC Trans ID", "noted_by_col": "NotedBy",
+        }
+
+    return {
+        "connections": {"spreadsheet_id": "bench"},
+        # Плановое обновление в бенчмарке не нужно: оно только добавило бы шум в замеры
+        "refresher": {"interval_seconds": 3600},
+        "users": users,
+        "companies": COMPANIES,
+        "teams": teams,
+        "directors": directors,
+        "page_settings": page_settings,
+    }
+
+
+def _toml_value(value):
+    # Строки, числа и списки строк в JSON записываются так же, как в TOML
+    return json.dumps(value, ensure_ascii=False)
+
+
+def to_toml(secrets, prefix=()):
+    """Простая запись secrets в TOML (вложенные словари — таблицами [a.b])."""
+    lines = []
+    tables = []
+    for key, value in secrets.items():
+        if isinstance(value, dict):
+            tables.append((key, value))
+        else:
+            lines.append(f"{json.dumps(key, ensure_ascii=False)} = {_toml_value(value)}")
+    for key, value in tables:
+        path = prefix + (key,)
+        lines.append("")
+        lines.append("[" + ".".join(json.dumps(part, ensure_ascii=False) for part in path) + "]")
+        lines.append(to_toml(value, path))
+    return "\n".join(lines)
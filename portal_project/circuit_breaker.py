@@ -0,0 +1,121 @@
+# circuit_breaker.py
+import time
+import random
+import threading
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Запрос не отправлен: предохранитель разомкнут после серии ошибок Google."""
+
+    def __init__(self, retry_in):
+        super().__init__(f"Google Sheets is unavailable, next attempt in {retry_in:.0f} s")
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для запросов к Google: после failure_threshold ошибок подряд запросы
+    перестают уходить на время паузы. Пауза растет экспоненциально с каждым новым размыканием
+    (base_delay * 2^n, не больше max_delay) и получает случайный разброс ±jitter,
+    чтобы несколько процессов не возвращались к Google одновременно.
+    По истечении паузы пропускается один пробный запрос: успех замыкает цепь, ошибка размыкает снова.
+    """
+
+    def __init__(self, failure_threshold=3, base_delay=5.0, max_delay=300.0, jitter=0.2,
+                 on_state_change=None, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self._on_state_change = on_state_change
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        # Сколько раз подряд цепь размыкалась без успешного запроса между ними (степень паузы)
+        self._trips = 0
+        self._retry_at = 0.0
+        self._probe_in_flight = False
+        self.last_error = None
+
+    def _set_state(self, state):
+        if state != self._state:
+            self._state = state
+            if self._on_state_change:
+                self._on_state_change(state)
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def retry_in(self):
+        """
+        Сколько секунд до следующей попытки (0, если запросы разрешены).
+        Пока идет пробный запрос, остальным ответ — пауза, которая начнется, если проба не пройдет.
+        """
+        with self._lock:
+            if self._state == OPEN:
+                return max(0.0, self._retry_at - self._clock())
+            if self._state == HALF_OPEN and self._probe_in_flight:
+                return min(self.max_delay, self.base_delay * 2 ** self._trips)
+            return 0.0
+
+    def is_open(self):
+        """True, если запросы сейчас не отправляются (пауза не истекла или идет пробный запрос)."""
+        with self._lock:
+            if self._state == OPEN:
+                return self._clock() < self._retry_at
+            return self._state == HALF_OPEN and self._probe_in_flight
+
+    def allow(self):
+        """Можно ли отправить запрос; после паузы пропускает ровно один пробный."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and self._clock() >= self._retry_at:
+                self._set_state(HALF_OPEN)
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trips = 0
+            self._probe_in_flight = False
+            self.last_error = None
+            self._set_state(CLOSED)
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            self.last_error = error
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                delay = min(self.max_delay, self.base_delay * 2 ** self._trips)
+                delay *= 1 + random.uniform(-self.jitter, self.jitter)
+                self._trips += 1
+                self._retry_at = self._clock() + delay
+                self._set_state(OPEN)
+
+    def call(self, fn, is_failure=lambda error: True):
+        """
+        Выполняет fn() через предохранитель. Если цепь разомкнута — CircuitOpenError без запроса.
+        is_failure(ошибка) решает, считается ли ошибка сбоем Google (например, «лист не найден» — нет).
+        """
+        if not self.allow():
+            raise CircuitOpenError(self.retry_in())
+        try:
+            result = fn()
+        except Exception as e:
+            if is_failure(e):
+                self.record_failure(e)
+            else:
+                self.record_success()
+            raise
+        self.record_success()
+        return result
@@ -0,0 +1,105 @@
+# components.py
+import math
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from styling import style_rows
+from utils import snapshot_updated_since, snapshot_checked_at, google_status
+
+# Варианты размера страницы таблицы (по умолчанию — второй)
+PAGE_SIZE_OPTIONS = [25, 50, 100, 250]
+NO_SORT = "—"
+# Как часто проверять, догрузился ли большой лист (секунд)
+PARTIAL_RECHECK_SECONDS = 2
+# Снимок старше этого показывается с пометкой о времени, даже если Google доступен (секунд)
+STALE_NOTICE_SECONDS = 15 * 60
+
+
+def _sort_positions(values: pd.Series, descending):
+    """Позиции строк в порядке сортировки; пустые значения всегда в конце."""
+    ordered = values.reset_index(drop=True).sort_values(ascending=not descending, na_position='last', kind='stable')
+    return ordered.index.to_numpy()
+
+
+def paginated_table(df: pd.DataFrame, key, row_styles=None, sort_keys=None, height=800, hide_index=None):
+    """
+    Таблица с постраничным выводом и сортировкой. Сортируются только позиции строк,
+    а срезается, стилизуется и уходит в браузер лишь видимое окно.
+
+    row_styles — CSS для каждой строки df (см. utils.load_row_styles);
+    sort_keys — типизированные колонки (utils.load_typed_columns), чтобы суммы и даты сортировались как числа.
+    """
+    total_rows = len(df)
+    sort_col_ui, order_col_ui, size_col_ui, page_col_ui = st.columns([3, 2, 2, 2])
+    sort_by = sort_col_ui.selectbox("Sort by", [NO_SORT] + list(df.columns), key=f"{key}_sort_by")
+    descending = order_col_ui.selectbox("Order", ["Ascending", "Descending"], key=f"{key}_order") == "Descending"
+    page_size = size_col_ui.selectbox("Rows per page", PAGE_SIZE_OPTIONS, index=1, key=f"{key}_page_size")
+
+    total_pages = max(1, math.ceil(total_rows / page_size))
+    page_key = f"{key}_page"
+    if st.session_state.get(page_key, 1) > total_pages:
+        st.session_state[page_key] = total_pages
+    page_number = page_col_ui.number_input(
+        f"Page (of {total_pages})", min_value=1, max_value=total_pages, step=1, key=page_key
+    )
+
+    positions = np.arange(total_rows)
+    if sort_by != NO_SORT:
+        if sort_keys is not None and sort_by in sort_keys.columns:
+            values = sort_keys[sort_by].reindex(df.index)
+        else:
+            values = df[sort_by]
+        positions = _sort_positions(values, descending)
+
+    page_start = (page_number - 1) * page_size
+    window_positions = positions[page_start:page_start + page_size]
+    window = df.iloc[window_positions].reset_index(drop=True)
+    if row_styles is None:
+        window_styles = [''] * len(window)
+    else:
+        window_styles = np.asarray(row_styles, dtype=object)[window_positions]
+
+    st.dataframe(style_rows(window, window_styles), use_container_width=True, height=height, hide_index=hide_index)
+    st.caption(f"Rows {page_start + 1 if len(window) else 0}–{page_start + len(window)} of {total_rows}")
+
+
+@st.fragment(run_every=PARTIAL_RECHECK_SECONDS)
+def _rerun_when_complete(worksheet_name, fetched_at):
+    if snapshot_updated_since(worksheet_name, fetched_at):
+        st.rerun()
+
+
+def _age_text(seconds):
+    minutes = int(seconds // 60)
+    if minutes < 1:
+        return "less than a minute ago"
+    if minutes < 120:
+        return f"{minutes} min ago"
+    return f"{minutes // 60} h ago"
+
+
+def snapshot_notice(df: pd.DataFrame):
+    """
+    Пометки о версии данных на странице:
+    если Google недоступен или снимок давно не обновлялся — с какого времени данные;
+    если страница построена по первому блоку большого листа (см. utils._fetch_chunked) —
+    сообщает об этом и перезапускает страницу, как только сохранен полный снимок.
+    """
+    checked_at = snapshot_checked_at(df)
+    if checked_at:
+        status = google_status()
+        age = time.time() - checked_at
+        as_of = datetime.fromtimestamp(checked_at).strftime("%d.%m %H:%M")
+        if status["state"] != "closed":
+            st.warning(f"⚠️ Google Sheets is temporarily unavailable. Showing data as of {as_of} "
+                       f"({_age_text(age)}); next attempt in {status['retry_in']:.0f} s.")
+        elif age > STALE_NOTICE_SECONDS:
+            st.caption(f"🕒 Data as of {as_of} ({_age_text(age)}).")
+    if not df.attrs.get("partial"):
+        return
+    st.caption("⏳ The sheet is still loading: showing the rows received so far.")
+    _rerun_when_complete(df.attrs["worksheet"], df.attrs["fetched_at"])
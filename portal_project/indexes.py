@@ -0,0 +1,232 @@
+# indexes.py
+import threading
+from collections import deque, defaultdict
+
+import numpy as np
+import pandas as pd
+
+
+def _group_positions(values: pd.Series):
+    """Уникальные значения и для каждого — массив позиций строк, где оно встречается."""
+    codes, uniques = pd.factorize(values)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    return list(uniques), [order[bounds[i]:bounds[i + 1]] for i in range(len(uniques))]
+
+
+class SalesIndex:
+    """
+    Индекс строк снимка по продавцу: очищенное имя продавца -> позиции строк.
+    Поиск по логину идет по уникальным именам (их сотни), а не по всем строкам листа.
+    """
+
+    def __init__(self, sales_series: pd.Series, strip_pattern=None):
+        clean = sales_series.astype(str).str.lower()
+        if strip_pattern:
+            clean = clean.str.replace(strip_pattern, '', regex=True)
+        self.values, groups = _group_positions(clean)
+        self.positions = dict(zip(self.values, groups))
+        self.row_count = len(clean)
+        self._login_rows = {}
+        self._lock = threading.Lock()
+
+    def rows_for_login(self, login):
+        """Позиции строк, где очищенное имя продавца содержит логин (как str.contains)."""
+        rows = self._login_rows.get(login)
+        if rows is None:
+            matched = [self.positions[value] for value in self.values if login in value]
+            rows = np.sort(np.concatenate(matched)) if matched else np.empty(0, dtype=np.intp)
+            with self._lock:
+                self._login_rows[login] = rows
+        return rows
+
+    def rows_for(self, logins):
+        """Позиции строк для любого из логинов (аналог '|'.join(logins) в str.contains)."""
+        logins = [login for login in logins if login]
+        if len(logins) == 1:
+            return self.rows_for_login(logins[0])
+        parts = [self.rows_for_login(login) for login in logins]
+        return np.unique(np.concatenate(parts)) if parts else np.empty(0, dtype=np.intp)
+
+
+class LoginMatcher:
+    """
+    Автомат Ахо–Корасик по логинам: за один проход по строке находит все логины,
+    которые в ней встречаются, вместо проверки каждого логина по отдельности.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for i, pattern in enumerate(self.patterns):
+            if not pattern:
+                continue
+            node = 0
+            for ch in pattern:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                    self._goto[node][ch] = nxt
+                node = nxt
+            self._out[node].append(i)
+
+        # Ссылки неудач строим обходом в ширину от корня
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text):
+        """Номера шаблонов (в порядке patterns), которые встречаются в text."""
+        node = 0
+        found = set()
+        for ch in text:
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            if self._out[node]:
+                found.update(self._out[node])
+        return sorted(found)
+
+
+class SheetRowIndex:
+    """
+    Адресация записей листа по снимку: ID записи -> номер строки на листе,
+    заголовок -> номер колонки. Позволяет писать сразу в нужную ячейку без sheet.find.
+    """
+
+    def __init__(self, df: pd.DataFrame, id_col):
+        self.columns = {}
+        for position, name in enumerate(df.columns, start=1):
+            self.columns.setdefault(name, position)
+        ids = df[id_col].astype(str).str.strip() if id_col in df.columns else pd.Series(dtype=str)
+        # Первая строка листа — заголовок, поэтому строка снимка i лежит в строке i + 2
+        is_first = ~ids.duplicated(keep='first').to_numpy()
+        self.rows = dict(zip(ids[is_first].tolist(), (np.flatnonzero(is_first) + 2).tolist()))
+
+    def locate(self, record_id, column):
+        """(строка, колонка) ячейки или None, если записи или колонки нет в снимке."""
+        row_number = self.rows.get(record_id)
+        col_number = self.columns.get(column)
+        if row_number is None or col_number is None:
+            return None
+        return row_number, col_number
+
+
+def _word_trigrams(text):
+    """Триграммы слов с отступами (как в pg_trgm) — для нечеткого поиска с опечатками."""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class SearchIndex:
+    """
+    Поисковый индекс колонки снимка: нормализованные (lower) уникальные значения,
+    триграммы подстрок для точного поиска и триграммы слов для поиска с опечатками.
+    """
+
+    # Доля триграмм запроса, которая должна найтись в значении при нечетком поиске
+    FUZZY_THRESHOLD = 0.4
+
+    def __init__(self, series: pd.Series):
+        clean = series.astype(str).str.lower()
+        self.values, self.groups = _group_positions(clean)
+        self.row_count = len(clean)
+        self._substring_grams = defaultdict(set)
+        self._word_grams = defaultdict(set)
+        for value_id, value in enumerate(self.values):
+            for i in range(len(value) - 2):
+                self._substring_grams[value[i:i + 3]].add(value_id)
+            for gram in _word_trigrams(value):
+                self._word_grams[gram].add(value_id)
+
+    def _rows(self, value_ids):
+        if not value_ids:
+            return np.empty(0, dtype=np.intp)
+        return np.sort(np.concatenate([self.groups[value_id] for value_id in value_ids]))
+
+    def find_values(self, term):
+        """Номера значений, содержащих term как подстроку (аналог str.contains без regex)."""
+        term = term.lower()
+        if len(term) < 3:
+            # Короткий запрос: триграмм нет, проверяем уникальные значения (их меньше, чем строк)
+            return [value_id for value_id, value in enumerate(self.values) if term in value]
+        grams = sorted({term[i:i + 3] for i in range(len(term) - 2)}, key=lambda g: len(self._substring_grams.get(g, ())))
+        candidates = set(self._substring_grams.get(grams[0], ()))
+        for gram in grams[1:]:
+            if not candidates:
+                break
+            candidates &= self._substring_grams.get(gram, set())
+        return sorted(value_id for value_id in candidates if term in self.values[value_id])
+
+    def find_similar_values(self, term):
+        """Номера значений, похожих на term по триграммам слов (для запросов с опечатками)."""
+        term_grams = _word_trigrams(term.lower())
+        if not term_grams:
+            return []
+        shared = defaultdict(int)
+        for gram in term_grams:
+            for value_id in self._word_grams.get(gram, ()):
+                shared[value_id] += 1
+        needed = self.FUZZY_THRESHOLD * len(term_grams)
+        return sorted(value_id for value_id, count in shared.items() if count >= needed)
+
+    def search(self, term, fuzzy=False):
+        """
+        Позиции строк по запросу и признак нечеткого результата.
+        Нечеткий поиск включается, только если точных совпадений нет.
+        """
+        value_ids = self.find_values(term)
+        if value_ids or not fuzzy:
+            return self._rows(value_ids), False
+        return self._rows(self.find_similar_values(term)), True
+
+
+class MonthPartitions:
+    """
+    Разбиение строк снимка по периодам (год, месяц) -> позиции строк.
+    Выбор месяца берет готовый список строк вместо прохода по всему листу.
+    Если колонки года нет, год в ключе — None. Строки с пустым годом лежат под (None, месяц)
+    и попадают в этот месяц любого года — как при фильтре только по месяцу.
+    """
+
+    def __init__(self, months: pd.Series, years: pd.Series = None):
+        self.row_count = len(months)
+        self.has_years = years is not None
+        frame = pd.DataFrame({"month": months.to_numpy()})
+        keys = ["month"]
+        if years is not None:
+            frame["year"] = years.to_numpy()
+            keys = ["year", "month"]
+        self.positions = {}
+        for key, rows in frame.groupby(keys, dropna=False).indices.items():
+            key = key if isinstance(key, tuple) else (key,)
+            year, month = key if years is not None else (None, key[0])
+            if pd.isna(month) or month != int(month) or not 1 <= month <= 12:
+                continue
+            self.positions[(None if pd.isna(year) else int(year), int(month))] = rows
+
+    def periods(self):
+        """Доступные периоды, от новых к старым (месяцы строк без года входят в периоды с годом)."""
+        periods = [period for period in self.positions if period[0] is not None or not self.has_years]
+        return sorted(periods, key=lambda period: (period[0] or 0, period[1]), reverse=True)
+
+    def rows_for(self, year, month):
+        """Позиции строк периода по возрастанию (пустой массив, если строк нет)."""
+        rows = self.positions.get((year, month), np.empty(0, dtype=np.intp))
+        undated = self.positions.get((None, month)) if self.has_years and year is not None else None
+        return rows if undated is None else np.union1d(rows, undated)
@@ -0,0 +1,185 @@
+# metrics.py
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+# Границы корзин гистограмм (секунды): от быстрых чтений кэша до медленных запросов к Google
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+# (имя, метки) -> значение
+_counters = {}
+# (имя, метки) -> {"buckets": [счетчики по корзинам], "count": n, "sum": s}
+_histograms = {}
+_help = {}
+# имя -> функция, которая в момент выгрузки возвращает [(метки, значение)]
+_gauges = {}
+_started_at = time.time()
+
+
+def _key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def describe(name, text):
+    """Описание метрики для строки # HELP в выгрузке Prometheus."""
+    _help[name] = text
+
+
+def gauge(name, fn):
+    """Регистрирует показатель текущего состояния (например, глубину очереди): fn() -> [(метки, значение)]."""
+    _gauges[name] = fn
+
+
+def inc(name, value=1, **labels):
+    """Увеличивает счетчик."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """Добавляет наблюдение (обычно длительность в секундах) в гистограмму."""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": [0] * len(DEFAULT_BUCKETS), "count": 0, "sum": 0.0}
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if value <= bound:
+                histogram["buckets"][i] += 1
+        histogram["count"] += 1
+        histogram["sum"] += value
+
+
+@contextmanager
+def timer(name, **labels):
+    """Замеряет длительность блока в гистограмму name (в том числе, если блок упал с ошибкой)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+@contextmanager
+def api_call(method, **labels):
+    """Один запрос к Google API: счетчик запросов, ошибок и гистограмма длительности."""
+    inc("portal_google_api_calls_total", method=method, **labels)
+    try:
+        with timer("portal_google_api_seconds", method=method, **labels):
+            yield
+    except Exception:
+        inc("portal_google_api_errors_total", method=method, **labels)
+        raise
+
+
+class PageRun:
+    """
+    Длительность одного прогона страницы: создается в начале скрипта, finish() — в конце.
+    Прогоны, прерванные st.stop(), не учитываются (это короткие ветки с сообщениями).
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self._started = time.perf_counter()
+
+    def finish(self):
+        observe("portal_page_run_seconds", time.perf_counter() - self._started, page=self.page)
+
+
+def quantile(histogram, q):
+    """Оценка квантиля по корзинам гистограммы (верхняя граница корзины); None, если данных нет."""
+    if not histogram["count"]:
+        return None
+    rank = q * histogram["count"]
+    for bound, count in zip(DEFAULT_BUCKETS, histogram["buckets"]):
+        if count >= rank:
+            return bound
+    return float("inf")
+
+
+def snapshot():
+    """Копия всех метрик: ({(имя, метки): значение}, {(имя, метки): гистограмма})."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: {**value, "buckets": list(value["buckets"])} for key, value in _histograms.items()}
+    return counters, histograms
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+
+def prometheus_text():
+    """Все метрики в текстовом формате Prometheus (exposition format 0.0.4)."""
+    counters, histograms = snapshot()
+    lines = [
+        "# TYPE portal_uptime_seconds gauge",
+        f"portal_uptime_seconds {time.time() - _started_at:.3f}",
+    ]
+    for name, fn in sorted(_gauges.items()):
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in fn():
+            lines.append(f"{name}{_format_labels(sorted(labels.items()))} {value}")
+    for name in sorted({name for name, _ in counters}):
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} counter")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+    for name in sorted({name for name, _ in histograms}):
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} histogram")
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            for bound, count in zip(DEFAULT_BUCKETS, histogram["buckets"]):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']:.6f}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path):
+    """Атомарно пишет выгрузку в файл (для textfile-коллектора node_exporter)."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)
+
+
+describe("portal_google_api_calls_total", "Requests to the Google Sheets API.")
+describe("portal_google_api_errors_total", "Google Sheets API requests that raised an error.")
+describe("portal_google_api_seconds", "Duration of Google Sheets API requests.")
+describe("portal_fetch_coalesced_total", "Sheet loads that waited for an identical in-flight load instead of calling Google.")
+describe("portal_snapshot_requests_total", "Snapshot lookups by result (hit, stale, miss).")
+describe("portal_pipeline_stage_runs_total", "Page pipeline stages computed (cache misses).")
+describe("portal_pipeline_stage_seconds", "Duration of computed page pipeline stages.")
+describe("portal_page_frame_seconds", "Time to produce a page frame through the pipeline, cache hits included.")
+describe("portal_page_run_seconds", "Duration of full page reruns.")
+describe("portal_acks_queued_total", "Notification acknowledgements queued.")
+describe("portal_ack_flushes_total", "Batches of acknowledgements written to the sheet.")
+describe("portal_acks_written_total", "Acknowledgements written to the sheet.")
+describe("portal_snapshot_load_seconds", "Duration of reading a snapshot from disk (snapshot cache misses).")
+describe("portal_page_frame_requests_total", "Page frames requested through the pipeline.")
+describe("portal_circuit_transitions_total", "Google read circuit breaker state changes by new state.")
+describe("portal_circuit_rejected_total", "Google reads skipped because the circuit breaker was open.")
+describe("portal_quota_wait_seconds", "Time a Google API request waited for the per-minute request budget.")
+describe("portal_quota_queued_total", "Google API requests that had to queue because the per-minute budget was used up.")
+describe("portal_quota_queue_depth", "Google API requests currently waiting for budget, by priority.")
+describe("portal_quota_used_requests", "Google API requests made in the last minute.")
+describe("portal_quota_budget_requests", "Per-minute Google API request budget (0 means unlimited).")
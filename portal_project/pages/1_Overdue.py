@@ -1,28 +1,15 @@
 # pages/1_Overdue.py
 import streamlit as st
 import pandas as pd
-from utils import load_data, load_lottieurl
+from utils import load_page_frame, load_page_total, load_lottieurl, load_typed_columns, load_row_styles
+from components import paginated_table, snapshot_notice
 from streamlit_lottie import st_lottie
-
-# --- Функция для исправления дубликатов колонок (оставляем для надежности) ---
-def sanitize_columns(df: pd.DataFrame) -> pd.DataFrame:
-    cols = list(df.columns)
-    new_cols = []
-    col_counts = {}
-    for col in cols:
-        clean_col = col.strip() if isinstance(col, str) else col
-        if clean_col in col_counts:
-            col_counts[clean_col] += 1
-            new_cols.append(f"{clean_col}_{col_counts[clean_col]}")
-        else:
-            col_counts[clean_col] = 0
-            new_cols.append(clean_col)
-    df.columns = new_cols
-    return df
+from metrics import PageRun
 
 # --- 1. НАСТРОЙКА СТРАНИЦЫ И ПРОВЕРКА ДОСТУПА ---
 LOGO_URL = "https://i.ibb.co/Qvy4G6DR/images.png"
 st.set_page_config(layout="wide", page_title="Overdue", page_icon=LOGO_URL)
+page_run = PageRun("overdue")
 
 
 if not st.session_state.get("authenticated", False):
@@ -148,45 +135,36 @@ with placeholder.container():
 # --- 3. ЗАГРУЗКА И ПРЕДВАРИТЕЛЬНАЯ ФИЛЬТРАЦИЯ ---
 # <-- ВОТ ЗДЕСЬ ПРОИСХОДИТ "ДОЛГАЯ" ОПЕРАЦИЯ
 
-df_original = load_data(worksheet_name=worksheet_name)
+# Лист + фильтр компании (включение filter_val для carolina_ff_mex, исключение exclude_vals для carolina_ff)
+# считаются конвейером utils.load_page_frame один раз на снимок
+df_original = load_page_frame(company_config)
 placeholder.empty()
+# Большой лист при первой загрузке приходит блоками: показываем первый блок и ждем остальные
+snapshot_notice(df_original)
 
-if not df_original.empty:
-    df_original = sanitize_columns(df_original)
-
-if df_original.empty:
+if df_original.empty and len(df_original.columns) == 0:
     st.warning(f"No overdue payments info found for {company_name} in the '{worksheet_name}' sheet.")
     st.stop()
 
-# --- ОБНОВЛЕННАЯ ЛОГИКА ФИЛЬТРАЦИИ ---
-# Сначала проверяем на ВКЛЮЧЕНИЕ (для carolina_ff_mex)
-if filter_col and filter_val and filter_col in df_original.columns:
-    df_original = df_original[df_original[filter_col] == filter_val].copy()
-# Потом проверяем на ИСКЛЮЧЕНИЕ (для carolina_ff)
-elif filter_col and exclude_vals and filter_col in df_original.columns:
-    if isinstance(exclude_vals, list):
-        # Используем .isin() с оператором `~` (НЕ) для исключения
-        df_original = df_original[~df_original[filter_col].isin(exclude_vals)].copy()
-    else:
-        st.warning("Configuration error: 'exclude_vals' should be a list in secrets.toml.")
+if filter_col and exclude_vals and not filter_val and not isinstance(exclude_vals, list):
+    st.warning("Configuration error: 'exclude_vals' should be a list in secrets.toml.")
 
 # Проверяем, не остались ли данные после фильтрации
 if df_original.empty:
     st.info(f"No data matching the specified filters was found for {company_name}.")
     st.stop()
 
-# --- 4. ФИЛЬТРАЦИЯ ПО ПОЛЬЗОВАТЕЛЮ (без изменений) ---
+# --- 4. ФИЛЬТРАЦИЯ ПО ПОЛЬЗОВАТЕЛЮ ---
 username = st.session_state.get("username", "").strip().lower()
 df_user = pd.DataFrame()
 
 if sales_col and sales_col in df_original.columns:
     if username in ["admin", "dariga","erik", "shelby","operations"]:
-        df_user = df_original.copy()
+        user_logins = None
     else:
-        simple_name = username.split('@')[0].replace('.', '').replace('-', '')
-        df_original['clean_sales'] = df_original[sales_col].astype(str).str.lower().str.replace(' ', '').str.replace('-', '')
-        df_user = df_original[df_original['clean_sales'].str.contains(simple_name, na=False)].copy()
-        df_user = df_user.drop(columns=['clean_sales'])
+        # Строки продавца берем из индекса снимка, без построчного поиска подстроки
+        user_logins = [username.split('@')[0].replace('.', '').replace('-', '')]
+    df_user = load_page_frame(company_config, logins=user_logins)
 else:
     st.error(f"Configuration Error: Sales column '{sales_col}' not found in the sheet '{worksheet_name}'.")
     st.stop()
@@ -195,12 +173,11 @@ if df_user.empty:
     st.info(f"No overdue payments found for you in {company_name}.")
     st.stop()
 
-# --- 5. ОТОБРАЖЕНИЕ (без изменений) ---
+# --- 5. ОТОБРАЖЕНИЕ ---
 total_sum_for_user = 0
 if total_col and total_col in df_user.columns:
-    cleaned_total = df_user[total_col].astype(str).str.replace(r'[^\d.-]', '', regex=True)
-    numeric_total = pd.to_numeric(cleaned_total, errors='coerce')
-    total_sum_for_user = numeric_total.dropna().sum()
+    # Итог считается один раз на снимок и набор логинов (см. utils.load_page_total)
+    total_sum_for_user = load_page_total(company_config, total_col, logins=user_logins)
 
 st.metric(label="Your Total Overdue", value=f"${total_sum_for_user:,.2f}")
 st.write("---")
@@ -209,21 +186,22 @@ search_term = ""
 if customer_col and customer_col in df_user.columns:
     search_term = st.text_input(f"Search by {customer_col.title()}:", placeholder="Enter client name...").strip().lower()
 
-df_display = df_user.copy()
-if search_term and customer_col in df_display.columns:
-    df_display = df_display[df_display[customer_col].astype(str).str.lower().str.contains(search_term, na=False)]
-
-def highlight_status(row):
-    if not status_col: return [''] * len(row)
-    style = [''] * len(row)
-    if status_col in row.index:
-        status = str(row[status_col]).strip().lower()
-        if status == 'blacklist':
-            style = ['background-color: black; color: white;'] * len(row)
-        elif status in ['on hold', 'claimed']:
-            style = ['background-color: lightcoral; color: black;'] * len(row)
-    return style
-
-df_display = df_display.reset_index(drop=True)
-
-st.dataframe(df_display.style.apply(highlight_status, axis=1), use_container_width=True, height=800)
\ No newline at end of file
+# Поиск по индексу снимка (при опечатке — похожие названия); отфильтрованные таблицы берутся из кэша
+df_display = load_page_frame(company_config, logins=user_logins, search_col=customer_col, search_term=search_term, fuzzy=True)
+if df_display.attrs.get("fuzzy_search") and not df_display.empty:
+    st.caption("No exact matches. Showing similar names.")
+
+# Подсветка по статусу посчитана один раз на снимок (styling.ROW_STYLE_RULES["overdue_status"])
+row_styles = load_row_styles(df_display, "overdue_status", status_col) if status_col else [''] * len(df_display)
+
+# В браузер уходит только текущая страница; суммы и даты сортируются по типизированным значениям
+paginated_table(
+    df_display,
+    key="overdue_table",
+    row_styles=row_styles,
+    sort_keys=load_typed_columns(df_display, company_config),
+    height=800,
+)
+
+# Время прогона страницы (см. страницу Diagnostics)
+page_run.finish()
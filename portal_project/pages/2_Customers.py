@@ -1,28 +1,15 @@
 # pages/2_Customers.py
 import streamlit as st
 import pandas as pd
-from utils import load_data, load_lottieurl
+from utils import load_page_frame, load_lottieurl, load_row_styles
+from components import paginated_table, snapshot_notice
 from streamlit_lottie import st_lottie
-
-# --- Функция для исправления дубликатов колонок ---
-def sanitize_columns(df: pd.DataFrame) -> pd.DataFrame:
-    cols = list(df.columns)
-    new_cols = []
-    col_counts = {}
-    for col in cols:
-        clean_col = col.strip() if isinstance(col, str) else col
-        if clean_col in col_counts:
-            col_counts[clean_col] += 1
-            new_cols.append(f"{clean_col}_{col_counts[clean_col]}")
-        else:
-            col_counts[clean_col] = 0
-            new_cols.append(clean_col)
-    df.columns = new_cols
-    return df
+from metrics import PageRun
 
 # --- 1. НАСТРОЙКА СТРАНИЦЫ И ПРОВЕРКА ДОСТУПА ---
 LOGO_URL = "https://i.ibb.co/Qvy4G6DR/images.png"
 st.set_page_config(layout="wide", page_title="Customers", page_icon=LOGO_URL)
+page_run = PageRun("customers")
 
 
 if not st.session_state.get("authenticated", False):
@@ -58,9 +45,6 @@ sales_col = company_config.get("sales_col")
 customer_col = company_config.get("customer_col")
 status_col = company_config.get("status_col")
 summary_cols_config = company_config.get("summary_cols", [])
-filter_col = company_config.get("filter_col")
-filter_val = company_config.get("filter_val")
-exclude_vals = company_config.get("exclude_vals")
 
 # --- 3. ЗАГРУЗКА И ПРЕДВАРИТЕЛЬНАЯ ФИЛЬТРАЦИЯ ---
 # 1. Загружаем саму анимацию
@@ -154,23 +138,16 @@ with placeholder.container():
 # --- 3. ЗАГРУЗКА И ПРЕДВАРИТЕЛЬНАЯ ФИЛЬТРАЦИЯ ---
 # <-- ВОТ ЗДЕСЬ ПРОИСХОДИТ "ДОЛГАЯ" ОПЕРАЦИЯ
 
-df_original = load_data(worksheet_name=worksheet_name)
+# Лист + фильтр по типу (включение/исключение) считаются конвейером utils.load_page_frame один раз на снимок
+df_original = load_page_frame(company_config)
 placeholder.empty()
+# Большой лист при первой загрузке приходит блоками: показываем первый блок и ждем остальные
+snapshot_notice(df_original)
 
-if not df_original.empty:
-    df_original = sanitize_columns(df_original)
-
-if df_original.empty:
+if df_original.empty and len(df_original.columns) == 0:
     st.warning(f"No customer info found for {company_name} in the '{worksheet_name}' sheet.")
     st.stop()
 
-# Логика фильтрации по типу (включение/исключение)
-if filter_col and filter_val and filter_col in df_original.columns:
-    df_original = df_original[df_original[filter_col] == filter_val].copy()
-elif filter_col and exclude_vals and filter_col in df_original.columns:
-    if isinstance(exclude_vals, list):
-        df_original = df_original[~df_original[filter_col].isin(exclude_vals)].copy()
-
 if df_original.empty:
     st.info(f"No data matching the specified filters was found for {company_name}.")
     st.stop()
@@ -181,12 +158,11 @@ df_user = pd.DataFrame()
 
 if sales_col and sales_col in df_original.columns:
     if username in ["admin", "dariga","erik", "shelby","operations"]:
-        df_user = df_original.copy()
+        user_logins = None
     else:
-        simple_name = username.split('@')[0].replace('.', '').replace('-', '')
-        df_original['clean_sales'] = df_original[sales_col].astype(str).str.lower().str.replace(' ', '').str.replace('-', '')
-        df_user = df_original[df_original['clean_sales'].str.contains(simple_name, na=False)].copy()
-        df_user = df_user.drop(columns=['clean_sales'])
+        # Строки продавца берем из индекса снимка, без построчного поиска подстроки
+        user_logins = [username.split('@')[0].replace('.', '').replace('-', '')]
+    df_user = load_page_frame(company_config, logins=user_logins)
 else:
     st.error(f"Configuration Error: Sales column '{sales_col}' not found in '{worksheet_name}'.")
     st.stop()
@@ -197,32 +173,30 @@ if df_user.empty:
 
 # --- 5. UI: ПОИСК И ФИЛЬТРЫ ---
 search_col, filter_col_ui = st.columns([2, 1]) 
-df_display = df_user.copy()
+# Параметры стадий конвейера: каждая комбинация считается один раз на снимок
+stage_params = {"logins": user_logins}
 
 with search_col:
-    if customer_col and customer_col in df_display.columns:
+    if customer_col and customer_col in df_user.columns:
         search_term = st.text_input(f"Search by {customer_col.title()}:", placeholder="Enter client name...").strip().lower()
         if search_term:
-            df_display = df_display[df_display[customer_col].astype(str).str.lower().str.contains(search_term, na=False)]
+            # Поиск по индексу снимка; при опечатке показываем похожие названия
+            stage_params.update(search_col=customer_col, search_term=search_term, fuzzy=True)
+df_display = load_page_frame(company_config, **stage_params)
+if df_display.attrs.get("fuzzy_search") and not df_display.empty:
+    search_col.caption("No exact matches. Showing similar names.")
 
 with filter_col_ui:
     if status_col and status_col in df_display.columns:
         status_options = ["All"] + sorted(df_display[status_col].dropna().unique())
         status_filter = st.selectbox(f"Filter by {status_col.title()}:", status_options)
         if status_filter != "All":
-            df_display = df_display[df_display[status_col] == status_filter]
+            stage_params["where"] = {status_col: status_filter}
+            df_display = load_page_frame(company_config, **stage_params)
 
 # --- 6. ОТОБРАЖЕНИЕ ТАБЛИЦЫ ---
-def highlight_status(row):
-    if not status_col: return [''] * len(row)
-    style = [''] * len(row)
-    if status_col in row.index:
-        status = str(row[status_col]).strip().lower()
-        if status == 'blacklist':
-            style = ['background-color: #555555; color: white;'] * len(row)
-        elif status in ['on hold', 'claimed']:
-            style = ['background-color: #FFCCCB; color: black;'] * len(row)
-    return style
+# Подсветка по статусу посчитана один раз на снимок (styling.ROW_STYLE_RULES["customers_status"])
+row_styles = load_row_styles(df_display, "customers_status", status_col) if status_col else [''] * len(df_display)
 
 st.write("---") 
 
@@ -231,16 +205,21 @@ if show_all_columns:
     st.info("💡 Detailed view is enabled. All columns are shown.")
     # df_display остается как есть
 else:
-    # Динамически выбираем колонки для краткого вида из конфига
-    existing_summary_columns = [col for col in summary_cols_config if col in df_display.columns]
-    if existing_summary_columns:
-        df_display = df_display[existing_summary_columns]
-
-df_display = df_display.reset_index(drop=True)
-
-st.dataframe(
-    df_display.style.apply(highlight_status, axis=1), 
-    use_container_width=True, 
+    # Краткий вид: колонки из конфига (стадия "columns" конвейера)
+    df_display = load_page_frame(company_config, columns=summary_cols_config, **stage_params)
+
+# Как и раньше, строки подсвечиваются, только если колонка статуса видна
+if not status_col or status_col not in df_display.columns:
+    row_styles = [''] * len(df_display)
+
+# В браузер уходит только текущая страница таблицы
+paginated_table(
+    df_display,
+    key="customers_table",
+    row_styles=row_styles,
     height=800,
     hide_index=True
-)
\ No newline at end of file
+)
+
+# Время прогона страницы (см. страницу Diagnostics)
+page_run.finish()
@@ -1,31 +1,16 @@
 # pages/3_Bonuses.py
 import streamlit as st
-import pandas as pd
 import calendar
 from datetime import datetime
-from utils import load_data, load_lottieurl
+from utils import load_page_frame, load_month_periods, load_lottieurl, load_typed_columns, load_row_styles
+from components import paginated_table, snapshot_notice
 from streamlit_lottie import st_lottie
-
-# --- ИСПРАВЛЕНИЕ 1: Добавляем функцию для исправления дубликатов колонок ---
-def sanitize_columns(df: pd.DataFrame) -> pd.DataFrame:
-    """Автоматически исправляет дубликаты колонок и убирает лишние пробелы."""
-    cols = list(df.columns)
-    new_cols = []
-    col_counts = {}
-    for col in cols:
-        clean_col = col.strip() if isinstance(col, str) else col
-        if clean_col in col_counts:
-            col_counts[clean_col] += 1
-            new_cols.append(f"{clean_col}_{col_counts[clean_col]}")
-        else:
-            col_counts[clean_col] = 0
-            new_cols.append(clean_col)
-    df.columns = new_cols
-    return df
+from metrics import PageRun
 
 # --- 1. НАСТРОЙКА СТРАНИЦЫ И ПРОВЕРКА ДОСТУПА ---
 LOGO_URL = "https://i.ibb.co/Qvy4G6DR/images.png"
 st.set_page_config(layout="wide", page_title="Bonus", page_icon=LOGO_URL)
+page_run = PageRun("bonuses")
 
 
 if not st.session_state.get("authenticated", False):
@@ -148,73 +133,81 @@ with placeholder.container():
 # --- 3. ЗАГРУЗКА И ПРЕДВАРИТЕЛЬНАЯ ФИЛЬТРАЦИЯ ---
 # <-- ВОТ ЗДЕСЬ ПРОИСХОДИТ "ДОЛГАЯ" ОПЕРАЦИЯ
 
-df_original = load_data(worksheet_name=worksheet_name)
+# Лист читается конвейером utils.load_page_frame: каждая стадия считается один раз на снимок
+df_original = load_page_frame(company_config)
 placeholder.empty()
-
-# Применяем санитарную обработку сразу после загрузки
-if not df_original.empty:
-    df_original = sanitize_columns(df_original)
+# Большой лист при первой загрузке приходит блоками: показываем первый блок и ждем остальные
+snapshot_notice(df_original)
 
 if df_original.empty:
     st.warning(f"No bonus info found for {company_name}.")
     st.stop()
 
 username = st.session_state.get("username", "").strip().lower()
+# Здесь из имени продавца убираются только пробелы
+stage_params = {"logins": None, "strip_pattern": " "}
 if username not in ["admin", "dariga","erik", "shelby","operations"]:
-    simple_name = username.split('@')[0].replace('.', '').replace('-', '')
     if sales_col and sales_col in df_original.columns:
-        df_original['clean_sales'] = df_original[sales_col].astype(str).str.lower().str.replace(' ', '')
-        df_user = df_original[df_original['clean_sales'].str.contains(simple_name, na=False)].copy()
-        df_user = df_user.drop(columns=['clean_sales'])
+        stage_params["logins"] = [username.split('@')[0].replace('.', '').replace('-', '')]
     else:
         st.error(f"Configuration Error: Sales column '{sales_col}' not found.")
         st.stop()
-else:
-    df_user = df_original.copy()
+df_user = load_page_frame(company_config, **stage_params)
 
 if df_user.empty:
     st.info(f"No bonus information found for you.")
     st.stop()
 
 # --- 4. UI: ПОИСК И ФИЛЬТРЫ ---
-df_display = df_user.copy()
-
-if shipment_col and shipment_col in df_display.columns:
+if shipment_col and shipment_col in df_user.columns:
     search_term = st.text_input(f"Search by {shipment_col}:", placeholder="Enter shipment number...").strip().lower()
     if search_term:
-        df_display = df_display[df_display[shipment_col].astype(str).str.lower().str.contains(search_term)]
-
-if month_col and month_col in df_display.columns:
-    # 1. Получаем номер текущего месяца (например, 10 для октября)
-    current_month_number = datetime.now().month
-    current_month_name = datetime.now().strftime('%B')
-
-    # 2. Информируем пользователя о том, что он видит
-    st.info(f"Displaying bonuses for the current month: **{current_month_name}**")
+        # Номера отправок ищем только точно: похожий номер — это другая отправка
+        stage_params.update(search_col=shipment_col, search_term=search_term)
+
+def period_label(period):
+    year, month = period
+    return f"{calendar.month_name[month]} {year}" if year else calendar.month_name[month]
+
+if month_col and month_col in df_user.columns:
+    # Лист разбит по месяцам (и годам, если задан year_col) один раз на снимок;
+    # по умолчанию — текущий месяц, прошлые месяцы берутся из того же снимка
+    now = datetime.now()
+    current_period = (now.year if company_config.get("year_col") else None, now.month)
+    periods = sorted(set(load_month_periods(company_config)) | {current_period},
+                     key=lambda period: (period[0] or 0, period[1]), reverse=True)
+    selected_period = st.selectbox("Month:", periods, index=periods.index(current_period), format_func=period_label)
+    stage_params["period"] = selected_period
+
+    if selected_period == current_period:
+        st.info(f"Displaying bonuses for the current month: **{period_label(selected_period)}**")
+    else:
+        st.info(f"Displaying bonuses for: **{period_label(selected_period)}**")
 
-    # 3. Применяем фильтр к DataFrame
-    # pd.to_numeric(..., errors='coerce') безопасно преобразует колонку в числа
-    df_display = df_display[pd.to_numeric(df_display[month_col], errors='coerce') == current_month_number]
 # --- 5. ОТОБРАЖЕНИЕ ТАБЛИЦЫ ---
 st.write("---")
 show_all_columns = st.toggle("Show all columns", value=False)
-if not show_all_columns:
-    existing_summary_cols = [col for col in summary_cols_config if col in df_display.columns]
-    if existing_summary_cols:
-        df_display = df_display[existing_summary_cols]
-
-def highlight_result(row):
-    style = [''] * len(row)
-    if result_col and result_col in row.index:
-        keywords = ["second part?", "ops need to fix", "error", "we or ops need fix"]
-        result_text = str(row[result_col]).strip().lower()
-        if any(keyword in result_text for keyword in keywords):
-            style = ['background-color: #FFCCCB; color: #721c24;'] * len(row)
-    return style
+# Краткий вид: колонки из конфига (стадия "columns" конвейера)
+df_display = load_page_frame(company_config, columns=None if show_all_columns else summary_cols_config, **stage_params)
+
+# Подсветка по ключевым словам результата посчитана один раз на снимок (styling.ROW_STYLE_RULES["bonus_result"])
+if result_col and result_col in df_display.columns:
+    row_styles = load_row_styles(df_display, "bonus_result", result_col)
+else:
+    row_styles = [''] * len(df_display)
 
 # --- ИСПРАВЛЕНИЕ 2: Добавляем проверку на пустой DataFrame ПЕРЕД стилизацией ---
 if df_display.empty:
     st.info("No records match your current search and filter criteria.")
 else:
-    df_display = df_display.reset_index(drop=True)
-    st.dataframe(df_display.style.apply(highlight_result, axis=1), use_container_width=True, height=800, hide_index=True)
\ No newline at end of file
+    paginated_table(
+        df_display,
+        key="bonus_table",
+        row_styles=row_styles,
+        sort_keys=load_typed_columns(df_display, company_config),
+        height=800,
+        hide_index=True,
+    )
+
+# Время прогона страницы (см. страницу Diagnostics)
+page_run.finish()
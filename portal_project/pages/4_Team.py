@@ -1,32 +1,26 @@
 # pages/4_Team.py
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import streamlit as st
 import pandas as pd
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from utils import (
-    load_data, 
+    load_page_frame,
+    prefetch_worksheets,
     create_username_to_fullname_map, 
+    load_typed_columns,
+    load_page_total,
+    load_kpi_rollup,
     load_lottieurl
 )
 from streamlit_lottie import st_lottie
-
-def sanitize_columns(df: pd.DataFrame) -> pd.DataFrame:
-    """Автоматически исправляет дубликаты колонок."""
-    cols = list(df.columns)
-    new_cols = []
-    col_counts = {}
-    for col in cols:
-        clean_col = col.strip() if isinstance(col, str) else col
-        if clean_col in col_counts:
-            col_counts[clean_col] += 1
-            new_cols.append(f"{clean_col}_{col_counts[clean_col]}")
-        else:
-            col_counts[clean_col] = 0
-            new_cols.append(clean_col)
-    df.columns = new_cols
-    return df
+from metrics import PageRun
+from components import paginated_table, snapshot_notice
 
 # --- 1. НАСТРОЙКА СТРАНИЦЫ И ПРОВЕРКА ДОСТУПА ---
 LOGO_URL = "https://i.ibb.co/Qvy4G6DR/images.png"
 st.set_page_config(layout="wide", page_title="Team Dashboard", page_icon=LOGO_URL)
+page_run = PageRun("team")
 
 
 if not st.session_state.get("authenticated", False): st.error("Please log in."); st.stop()
@@ -90,37 +84,6 @@ with placeholder.container():
 
 name_map = create_username_to_fullname_map()
 
-def load_and_prepare_data(page_name):
-    config = st.secrets.get("page_settings", {}).get(page_name, {}).get(company_key, {})
-    if not config or not config.get("worksheet"): return pd.DataFrame(), {}
-    
-    df = load_data(worksheet_name=config["worksheet"])
-    if df.empty: return pd.DataFrame(), config
-
-    df = df.reset_index(drop=True)
-    df = sanitize_columns(df)
-
-    filter_col, filter_val = config.get("filter_col"), config.get("filter_val")
-    exclude_vals = config.get("exclude_vals")
-    if filter_col and filter_col in df.columns:
-        # Вариант А: Оставляем только конкретное значение
-        if filter_val is not None:
-            df = df[df[filter_col] == filter_val].copy()
-        
-        # Вариант Б: Исключаем список значений (здесь была ошибка)
-        elif exclude_vals and isinstance(exclude_vals, list):
-            df = df[~df[filter_col].isin(exclude_vals)].copy()
-    else:
-        # Если колонка в secrets указана, но в таблице её нет — выводим предупреждение для отладки
-        if filter_col:
-            st.warning(f"Column '{filter_col}' not found in {config['worksheet']}. Check secrets or sheet headers.")
-        
-    return df, config
-
-df_customers, cfg_customers = load_and_prepare_data("customers")
-df_overdue, cfg_overdue = load_and_prepare_data("overdue")
-df_bonuses, cfg_bonuses = load_and_prepare_data("bonuses")
-
 placeholder.empty()
 
 # --- 3. ЛОГИКА ФИЛЬТРАЦИИ ПО КОМАНДАМ (УПРОЩЕННАЯ И ИСПРАВЛЕННАЯ) ---
@@ -130,6 +93,7 @@ allowed_users_logins = get_viewable_logins(username, company_key)
 
 fullname_map = {v: k for k, v in name_map.items()}
 selected_member_login = None
+selected_team = None
 member_logins_options = set()
 
 if allowed_users_logins == "SEE_ALL":
@@ -164,50 +128,173 @@ if selected_member_login:
 elif member_logins_options:
     final_logins_to_filter = [name.split('@')[0].lower() for name in member_logins_options]
 
-def filter_df_by_sales(df, sales_col_name):
+def load_and_prepare_data(page_name):
+    """Лист страницы после фильтра компании + предупреждения для вкладки (выполняется в пуле потоков)."""
+    config = st.secrets.get("page_settings", {}).get(page_name, {}).get(company_key, {})
+    if not config or not config.get("worksheet"): return pd.DataFrame(), {}, []
+    
+    # Лист + фильтр компании (filter_val / exclude_vals) — общий конвейер utils.load_page_frame
+    df = load_page_frame(config)
+    if df.empty: return pd.DataFrame(), config, []
+
+    warnings = []
+    filter_col = config.get("filter_col")
+    if filter_col and filter_col not in df.columns:
+        # Если колонка в secrets указана, но в таблице её нет — выводим предупреждение для отладки
+        warnings.append(f"Column '{filter_col}' not found in {config['worksheet']}. Check secrets or sheet headers.")
+        
+    return df, config, warnings
+
+# Стадии конвейера для строк выбранных участников: по ним же считаются итоги вкладок
+team_frame_params = {"logins": final_logins_to_filter, "strip_pattern": r'[\s-]'} if final_logins_to_filter else {}
+
+def filter_df_by_sales(df, config):
     if not final_logins_to_filter:
         return df if allowed_users_logins == "SEE_ALL" else pd.DataFrame(columns=df.columns)
         
+    sales_col_name = config.get("sales_col")
     if not sales_col_name or sales_col_name not in df.columns:
         return pd.DataFrame(columns=df.columns)
 
-    df['clean_sales'] = df[sales_col_name].astype(str).str.lower().str.replace(r'[\s-]', '', regex=True)
-    filter_regex = '|'.join(final_logins_to_filter)
-    mask = df['clean_sales'].str.contains(filter_regex, na=False)
-    
-    return df[mask].drop(columns=['clean_sales'])
+    # Строки выбранных логинов — стадия конвейера, закэшированная для этого набора логинов
+    return load_page_frame(config, **team_frame_params)
 
-df_customers = filter_df_by_sales(df_customers, cfg_customers.get("sales_col"))
-df_overdue = filter_df_by_sales(df_overdue, cfg_overdue.get("sales_col"))
-df_bonuses = filter_df_by_sales(df_bonuses, cfg_bonuses.get("sales_col"))
+def visible_team_names():
+    """Команды, которые пользователь видит в сводке (с учетом фильтра 'Filter by Team')."""
+    company_teams = st.secrets.get("teams", {}).get(company_key, {})
+    if allowed_users_logins == "SEE_ALL":
+        return [selected_team] if selected_team not in (None, "All Teams") else list(company_teams)
+    assigned_teams = st.secrets.get("directors", {}).get(company_key, {}).get(username)
+    if assigned_teams:
+        return [assigned_teams] if isinstance(assigned_teams, str) else list(assigned_teams)
+    return [username] if username in company_teams else []
 
-# --- 4. ОТОБРАЖЕНИЕ ВКЛАДОК ---
-st.write("---")
-customers_tab, overdue_tab, bonuses_tab = st.tabs(["Customers", "Overdue", "Bonuses"])
+def prepare_leaderboard():
+    """Сводка по компании считается один раз на снимок; здесь — только выборка нужных строк."""
+    members_kpis, teams_kpis = load_kpi_rollup(company_key)
+    visible_members = [selected_member_login] if selected_member_login else sorted(member_logins_options)
+    members_view = members_kpis.loc[members_kpis.index.intersection(visible_members)]
+    teams_view = teams_kpis.loc[teams_kpis.index.intersection(visible_team_names())]
+    return (members_view, teams_view), []
+
+def prepare_tab_data(page_name):
+    """Загрузка и фильтрация по команде для одной вкладки."""
+    df, config, warnings = load_and_prepare_data(page_name)
+    return (filter_df_by_sales(df, config), config), warnings
 
-with customers_tab:
-    st.header("Team's Customers")
+def run_prepare(prepare):
+    """
+    Подготовка вкладки без вывода на страницу: ошибка возвращается вместе с данными
+    и показывается из основного потока (сообщения Streamlit из нескольких потоков сразу не выводим).
+    """
+    try:
+        render_args, warnings = prepare()
+        return render_args, warnings, None
+    except Exception as e:
+        return None, [], f"Could not prepare this tab: {e}"
+
+# --- 4. ОТОБРАЖЕНИЕ ВКЛАДОК ---
+def render_customers(df_customers, cfg_customers):
     if df_customers.empty: st.info("No customer data available for the current selection.")
     else:
         summary_cols = cfg_customers.get("summary_cols", list(df_customers.columns))
         display_cols = [col for col in summary_cols if col in df_customers.columns]
-        st.dataframe(df_customers[display_cols].reset_index(drop=True), use_container_width=True, height=600, hide_index=True)
+        paginated_table(df_customers[display_cols], key="team_customers", height=600, hide_index=True)
 
-with overdue_tab:
-    st.header("Team's Overdue Payments")
+def render_overdue(df_overdue, cfg_overdue):
     if df_overdue.empty: st.info("No overdue payment data available for the current selection.")
     else:
         total_col = cfg_overdue.get("total_col")
         if total_col and total_col in df_overdue.columns:
-            cleaned_total = df_overdue[total_col].astype(str).str.replace(r'[^\d.-]', '', regex=True)
-            numeric_total = pd.to_numeric(cleaned_total, errors='coerce')
-            st.metric(label="Total Overdue Amount", value=f"${numeric_total.dropna().sum():,.2f}")
+            # Итог по снимку и набору участников считается один раз (см. utils.load_page_total)
+            overdue_total = load_page_total(cfg_overdue, total_col, **team_frame_params)
+            st.metric(label="Total Overdue Amount", value=f"${overdue_total:,.2f}")
             st.write("---")
-        st.dataframe(df_overdue.reset_index(drop=True), use_container_width=True, height=600, hide_index=True)
+        paginated_table(df_overdue, key="team_overdue", sort_keys=load_typed_columns(df_overdue, cfg_overdue), height=600, hide_index=True)
 
-with bonuses_tab:
-    st.header("Team's Bonuses")
+def render_bonuses(df_bonuses, cfg_bonuses):
     if df_bonuses.empty: st.info("No bonus data available for the current selection.")
     else:
+        paginated_table(df_bonuses, key="team_bonuses", sort_keys=load_typed_columns(df_bonuses, cfg_bonuses), height=600, hide_index=True)
+
+def leaderboard_table(kpis, label_col, labels):
+    """Таблица лидеров: подписи вместо логинов, сортировка по сумме просрочек."""
+    table = kpis.copy()
+    table.insert(0, label_col, [labels(key) for key in table.index])
+    if "Overdue Total" in table.columns:
+        table = table.sort_values("Overdue Total", ascending=False)
+    return table.reset_index(drop=True)
+
+def render_leaderboard(members_view, teams_view):
+    if members_view.empty and teams_view.empty:
+        st.info("No KPI data available for the current selection.")
+        return
+    if not teams_view.empty:
+        st.subheader("Teams")
+        teams_table = leaderboard_table(teams_view, "Team", lambda team: name_map.get(team, team))
+        st.dataframe(teams_table, use_container_width=True, hide_index=True,
+                     column_config={"Overdue Total": st.column_config.NumberColumn(format="$%.2f")})
+    if not members_view.empty:
+        st.subheader("Team Members")
+        members_table = leaderboard_table(members_view, "Member", lambda login: name_map.get(login, login.capitalize()))
+        st.dataframe(members_table, use_container_width=True, hide_index=True,
+                     column_config={"Overdue Total": st.column_config.NumberColumn(format="$%.2f")})
+
+st.write("---")
+customers_tab, overdue_tab, bonuses_tab, leaderboard_tab = st.tabs(["Customers", "Overdue", "Bonuses", "Leaderboard"])
+
+# Вкладка: (контейнер, заголовок, подготовка данных в потоке, функция отрисовки)
+TEAM_TABS = {
+    "customers": (customers_tab, "Team's Customers", lambda: prepare_tab_data("customers"), render_customers),
+    "overdue": (overdue_tab, "Team's Overdue Payments", lambda: prepare_tab_data("overdue"), render_overdue),
+    "bonuses": (bonuses_tab, "Team's Bonuses", lambda: prepare_tab_data("bonuses"), render_bonuses),
+    "leaderboard": (leaderboard_tab, "Team Leaderboard", prepare_leaderboard, render_leaderboard),
+}
+
+tab_slots = {}
+for page_name, (tab, header, _, _) in TEAM_TABS.items():
+    with tab:
+        st.header(header)
+        tab_slots[page_name] = st.empty()
+        tab_slots[page_name].caption("Loading...")
+
+def show_tab(page_name, render_args, tab_warnings, error):
+    with tab_slots[page_name].container():
+        for message in tab_warnings:
+            st.warning(message)
+        if error:
+            st.error(error)
+            return
+        snapshot_notice(render_args[0])
+        TEAM_TABS[page_name][3](*render_args)
+
+# Листы всех вкладок — одним batch-запросом до запуска потоков (см. utils.prefetch_worksheets)
+team_worksheets = {
+    page_name: st.secrets.get("page_settings", {}).get(page_name, {}).get(company_key, {}).get("worksheet")
+    for page_name in ("customers", "overdue", "bonuses")
+}
+versions = prefetch_worksheets(team_worksheets.values())
+# Лист без снимка (не найден, Google недоступен) читается в основном потоке: его сообщения об ошибке
+# выводит utils.load_data, а из потоков пула они не выводятся
+on_script_thread = [page_name for page_name, name in team_worksheets.items() if name and versions.get(name) is None]
+for page_name in on_script_thread:
+    show_tab(page_name, *run_prepare(TEAM_TABS[page_name][2]))
+
+# Остальные вкладки обрабатываются параллельно (фильтр, сводка) — данные уже в снимках.
+# Потокам передаем контекст сессии, чтобы кэши Streamlit работали как в основном потоке.
+script_ctx = get_script_run_ctx()
+with ThreadPoolExecutor(
+    max_workers=len(TEAM_TABS),
+    initializer=lambda: add_script_run_ctx(threading.current_thread(), script_ctx),
+) as pool:
+    futures = {
+        pool.submit(run_prepare, prepare): page_name
+        for page_name, (_, _, prepare, _) in TEAM_TABS.items() if page_name not in on_script_thread
+    }
+    # Каждая вкладка отрисовывается, как только готовы ее данные (виджеты — только из основного потока)
+    for future in as_completed(futures):
+        page_name = futures[future]
+        show_tab(page_name, *future.result())
 
-        st.dataframe(df_bonuses.reset_index(drop=True), use_container_width=True, height=600, hide_index=True)
+# Время прогона страницы (см. страницу Diagnostics)
+page_run.finish()
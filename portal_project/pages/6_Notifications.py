@@ -1,14 +1,16 @@
 # pages/3_Notification_History.py
 import streamlit as st
+import re
+import math
 import pandas as pd
-import gspread
-from utils import load_data, get_spreadsheet
 from urllib.parse import quote
-from utils import load_data, load_lottieurl
-from streamlit_lottie import st_lottie
+from utils import load_data, load_lottieurl, load_typed_columns, filter_by_sales, queue_notification_ack, apply_pending_acks
+from components import snapshot_notice
+from metrics import PageRun
 # --- 1. НАСТРОЙКА СТРАНИЦЫ И ПРОВЕРКА ДОСТУПА ---
 LOGO_URL = "https://i.ibb.co/Qvy4G6DR/images.png"
 st.set_page_config(layout="wide", page_title="Notifications", page_icon=LOGO_URL)
+page_run = PageRun("notifications")
 
 
 if not st.session_state.get("authenticated", False):
@@ -48,31 +50,16 @@ filter_col = company_config.get("filter_col")
 filter_val = company_config.get("filter_val")
 exclude_vals = company_config.get("exclude_vals")
 
+# Сколько карточек уведомлений показывать на одной странице
+NOTIFICATIONS_PAGE_SIZE = 20
+
 # --- 3. ФУНКЦИЯ ОБНОВЛЕНИЯ GOOGLE SHEET ---
 def update_notification_status(sheet_name, id_to_update, username_to_add, id_col_name, noted_by_col_name):
-    """Находит уведомление по ID и добавляет пользователя в список 'отметивших'."""
-    try:
-        sh = get_spreadsheet()
-        if not sh: return False
-        sheet = sh.worksheet(sheet_name)
-        
-        cell = sheet.find(str(id_to_update), in_column=sheet.find(id_col_name).col)
-        if not cell: return False
-        
-        headers = sheet.row_values(1)
-        noted_by_col_index = headers.index(noted_by_col_name) + 1
-        
-        current_noted_by_str = sheet.cell(cell.row, noted_by_col_index).value or ""
-        noted_by_list = [name.strip() for name in current_noted_by_str.split(',') if name.strip()]
-        
-        if username_to_add not in noted_by_list:
-            noted_by_list.append(username_to_add)
-            new_noted_by_str = ', '.join(noted_by_list)
-            sheet.update_cell(cell.row, noted_by_col_index, new_noted_by_str)
-            st.cache_data.clear() # Очищаем кэш для обновления страницы
-        return True
-    except Exception:
-        return False
+    """
+    Добавляет пользователя в список 'отметивших'. Запись в Google идет пачкой из фоновой очереди,
+    а до ее завершения отметка накладывается на данные страницы (см. apply_pending_acks).
+    """
+    return queue_notification_ack(sheet_name, str(id_to_update), username_to_add, id_col_name, noted_by_col_name)
 
 # --- 4. ЗАГРУЗКА И ФИЛЬТРАЦИЯ ДАННЫХ ---
 # 1. Загружаем саму анимацию
@@ -162,6 +149,8 @@ with placeholder.container():
 
 df_original = load_data(worksheet_name=worksheet_name)
 placeholder.empty()
+# Возраст снимка и недоступность Google видны до того, как пользователь отмечает уведомления
+snapshot_notice(df_original)
 
 if df_original.empty:
     st.info(f"No upcoming 30-day expirations were found for {company_name}.")
@@ -173,6 +162,9 @@ if not all(col and col in df_original.columns for col in required_cols):
     st.error(f"The '{worksheet_name}' sheet is missing one or more required columns defined in secrets.toml.")
     st.stop()
 
+# Отметки «Noted», которые еще в очереди записи, показываем сразу
+df_original = apply_pending_acks(df_original, worksheet_name, id_col, noted_by_col)
+
 # Фильтрация (включение/исключение)
 if filter_col and filter_val and filter_col in df_original.columns:
     df_original = df_original[df_original[filter_col] == filter_val].copy()
@@ -184,8 +176,7 @@ username = st.session_state.get("username", "").strip().lower()
 simple_name = username.split('@')[0].replace('.', '').replace('-', '')
 
 if username not in ["admin", "dariga","erik", "shelby","operations"]:
-    mask = df_original[sales_col].str.strip().str.lower().str.contains(simple_name, na=False)
-    df_display = df_original[mask].copy()
+    df_display = filter_by_sales(df_original, sales_col, [simple_name], strip_pattern=None).copy()
 else:
     df_display = df_original.copy()
 
@@ -196,17 +187,36 @@ if df_display.empty:
     st.success(f"No expiration notifications found for you in {company_name}.")
 else:
     df_display[noted_by_col] = df_display[noted_by_col].fillna('')
-    df_display['is_noted_by_user'] = df_display[noted_by_col].apply(lambda x: simple_name in x.lower().split(','))
-    df_display['SortableDate'] = pd.to_datetime(df_display[expiry_date_col], errors='coerce')
+    # Логин ищется среди имен через запятую одним векторным проходом (без split по каждой строке)
+    noted_by_pattern = rf"(?:^|,)\s*{re.escape(simple_name)}\s*(?:,|$)"
+    df_display['is_noted_by_user'] = df_display[noted_by_col].str.lower().str.contains(noted_by_pattern, regex=True)
+    typed_columns = load_typed_columns(df_display, company_config)
+    if expiry_date_col in typed_columns.columns:
+        df_display['SortableDate'] = typed_columns[expiry_date_col]
+    else:
+        df_display['SortableDate'] = pd.to_datetime(df_display[expiry_date_col], errors='coerce')
     df_display = df_display.sort_values(by=['is_noted_by_user', 'SortableDate'], ascending=[True, True])
 
-    st.write(f"#### Showing {len(df_display)} notifications:")
+    # Рисуем только одну страницу карточек, чтобы число виджетов не зависело от длины списка
+    total_pages = max(1, math.ceil(len(df_display) / NOTIFICATIONS_PAGE_SIZE))
+    if st.session_state.get("notifications_page", 1) > total_pages:
+        st.session_state["notifications_page"] = total_pages
+    page_number = 1
+    if total_pages > 1:
+        page_number = st.number_input(
+            f"Page (of {total_pages})", min_value=1, max_value=total_pages, step=1, key="notifications_page"
+        )
+    page_start = (page_number - 1) * NOTIFICATIONS_PAGE_SIZE
+    df_page = df_display.iloc[page_start:page_start + NOTIFICATIONS_PAGE_SIZE]
+
+    pending_count = int((~df_display['is_noted_by_user']).sum())
+    st.write(f"#### Showing {page_start + 1}–{page_start + len(df_page)} of {len(df_display)} notifications ({pending_count} not noted yet):")
     
-    for _, row in df_display.iterrows():
+    for _, row in df_page.iterrows():
         client_name_val = row[client_col]
         trans_id_val = str(row[id_col]).strip()
         noted_by_val = row[noted_by_col]
-        is_noted_by_me = simple_name in [name.strip().lower() for name in noted_by_val.split(',')]
+        is_noted_by_me = row['is_noted_by_user']
         
         # Ссылка для перехода на страницу Customers
         link = f"Customers?search={quote(client_name_val)}"
@@ -235,4 +245,7 @@ else:
                 key=f"noted_{trans_id_val}",
                 on_click=update_notification_status,
                 args=(worksheet_name, trans_id_val, simple_name, id_col, noted_by_col)
-            )
\ No newline at end of file
+            )
+
+# Время прогона страницы (см. страницу Diagnostics)
+page_run.finish()
@@ -0,0 +1,112 @@
+# pages/7_Diagnostics.py
+import streamlit as st
+import pandas as pd
+import metrics
+from utils import google_status, get_quota_scheduler
+
+# --- 1. НАСТРОЙКА СТРАНИЦЫ И ПРОВЕРКА ДОСТУПА ---
+LOGO_URL = "https://i.ibb.co/Qvy4G6DR/images.png"
+st.set_page_config(layout="wide", page_title="Diagnostics", page_icon=LOGO_URL)
+
+if not st.session_state.get("authenticated", False):
+    st.error("Please log in to view this page.")
+    if st.button("Go to Login Page"): st.switch_page("portal.py")
+    st.stop()
+
+username = st.session_state.get("username", "")
+if st.secrets.get("users", {}).get(username, {}).get("company") != "admin":
+    st.error("This page is available to administrators only.")
+    st.stop()
+
+st.title("🩺 Data Layer Diagnostics")
+st.caption("Metrics of this server process since its start. Every user session shares them.")
+
+counters, histograms = metrics.snapshot()
+
+
+def _labels_text(labels):
+    return ", ".join(f"{key}={value}" for key, value in labels)
+
+
+def _counter_total(name, **match):
+    """Сумма счетчика по всем меткам, совпадающим с match."""
+    return sum(
+        value for (metric, labels), value in counters.items()
+        if metric == name and all(dict(labels).get(key) == value_ for key, value_ in match.items())
+    )
+
+
+# --- 2. СВОДКА ---
+api_calls = _counter_total("portal_google_api_calls_total")
+api_errors = _counter_total("portal_google_api_errors_total")
+snapshot_hits = _counter_total("portal_snapshot_requests_total", result="hit")
+snapshot_lookups = _counter_total("portal_snapshot_requests_total")
+frame_requests = _counter_total("portal_page_frame_requests_total")
+stage_runs = _counter_total("portal_pipeline_stage_runs_total")
+coalesced = _counter_total("portal_fetch_coalesced_total")
+
+col1, col2, col3, col4, col5 = st.columns(5)
+col1.metric("Google API calls", api_calls)
+col2.metric("Google API errors", api_errors)
+col3.metric("Coalesced sheet loads", coalesced)
+col4.metric("Fresh snapshot hits", f"{snapshot_hits / snapshot_lookups:.0%}" if snapshot_lookups else "—")
+col5.metric("Pipeline stages per page frame", f"{stage_runs / frame_requests:.2f}" if frame_requests else "—")
+
+status = google_status()
+if status["state"] == "closed":
+    st.success("Google reads: circuit closed, requests go through.")
+else:
+    st.warning(f"Google reads: circuit {status['state'].replace('_', '-')}, pages are served from snapshots. "
+               f"Next attempt in {status['retry_in']:.0f} s. Last error: {status['last_error']}")
+
+# --- 3. КВОТА GOOGLE API ---
+st.write("---")
+st.subheader("Google API quota")
+quota_stats = get_quota_scheduler().stats()
+budget = quota_stats["budget"]
+col1, col2, col3 = st.columns(3)
+col1.metric("Requests in the last minute", f"{quota_stats['used']} / {budget}" if budget else quota_stats["used"])
+col2.metric("Queued now", sum(quota_stats["queue_depth"].values()))
+col3.metric("Requests that waited for budget", _counter_total("portal_quota_queued_total"))
+st.caption("Queued by priority: " + ", ".join(f"{name} {depth}" for name, depth in quota_stats["queue_depth"].items())
+           + f". {quota_stats['reserved']} requests per minute are kept for interactive page loads."
+           + " Wait times are in the portal_quota_wait_seconds rows below.")
+
+# --- 4. ТАЙМИНГИ ---
+st.write("---")
+st.subheader("Timings")
+timing_rows = []
+for (name, labels), histogram in sorted(histograms.items()):
+    p50, p95, p99 = (metrics.quantile(histogram, q) for q in (0.5, 0.95, 0.99))
+    timing_rows.append({
+        "Metric": name,
+        "Labels": _labels_text(labels),
+        "Count": histogram["count"],
+        "Avg, s": round(histogram["sum"] / histogram["count"], 4) if histogram["count"] else None,
+        "p50 ≤, s": p50,
+        "p95 ≤, s": p95,
+        "p99 ≤, s": p99,
+    })
+if timing_rows:
+    st.dataframe(pd.DataFrame(timing_rows), use_container_width=True, hide_index=True)
+else:
+    st.info("No timings recorded yet.")
+
+# --- 5. СЧЕТЧИКИ ---
+st.subheader("Counters")
+counter_rows = [
+    {"Metric": name, "Labels": _labels_text(labels), "Value": value}
+    for (name, labels), value in sorted(counters.items())
+]
+if counter_rows:
+    st.dataframe(pd.DataFrame(counter_rows), use_container_width=True, hide_index=True)
+else:
+    st.info("No counters recorded yet.")
+
+# --- 6. ВЫГРУЗКА PROMETHEUS ---
+st.write("---")
+st.subheader("Prometheus export")
+exposition = metrics.prometheus_text()
+st.download_button("⬇️ Download metrics.prom", exposition, file_name="metrics.prom", mime="text/plain")
+with st.expander("Show exposition text"):
+    st.code(exposition, language="text")
@@ -1,6 +1,6 @@
 # portal.py
 import streamlit as st
-from utils import create_username_to_fullname_map
+from utils import resolve_display_name
 
 # --- Конфигурация страницы ---
 LOGO_URL = "https://i.ibb.co/Qvy4G6DR/images.png"
@@ -21,6 +21,18 @@ hide_sidebar_nav_style = """
 
 # --- Функции ---
 
+def get_display_name():
+    """
+    Имя пользователя ищется один раз на выбранную компанию (сначала в ее справочнике) и хранится в session_state.
+    До выбора компании у пользователя с несколькими компаниями имя берется из любой, после выбора — уточняется.
+    """
+    selected_company = st.session_state.get('selected_company')
+    if "display_name" not in st.session_state or st.session_state.get('display_name_company') != selected_company:
+        username = st.session_state.get("username", "User")
+        st.session_state['display_name'] = resolve_display_name(username, selected_company)
+        st.session_state['display_name_company'] = selected_company
+    return st.session_state['display_name']
+
 def show_login_form():
     """Отображает форму входа и обрабатывает логин."""
     st.markdown(hide_sidebar_nav_style, unsafe_allow_html=True)
@@ -64,9 +76,7 @@ def show_admin_company_selection():
 # --- НОВАЯ ФУНКЦИЯ ---
 def show_user_company_selection(user_companies):
     """Показывает экран выбора для пользователей с доступом к нескольким компаниям."""
-    username = st.session_state.get("username", "User")
-    name_map = create_username_to_fullname_map()
-    display_name = name_map.get(username, username.capitalize())
+    display_name = get_display_name()
 
     st.title(f"Welcome, {display_name}!")
     st.header("Please select a company to continue")
@@ -89,8 +99,7 @@ def show_main_page():
     
     company_name = st.secrets["companies"].get(selected_company_key, "Selected Company")
     
-    name_map = create_username_to_fullname_map()
-    display_name = name_map.get(username, username.capitalize())
+    display_name = get_display_name()
 
     st.title(f"Welcome, {display_name}!")
     st.success(f"You are working with: **{company_name}**")
@@ -105,11 +114,9 @@ def show_main_page():
 # --- ИЗМЕНЕННАЯ ФУНКЦИЯ ---
 def setup_sidebar():
     """Настраивает боковую панель с корректным отображением компании."""
-    name_map = create_username_to_fullname_map()
-    
     with st.sidebar:
         username = st.session_state.get("username", "Guest")
-        display_name = name_map.get(username, username.capitalize())
+        display_name = get_display_name()
         
         st.write(f"Logged in as: **{display_name}**")
 
@@ -0,0 +1,126 @@
+# quota.py
+import time
+import heapq
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+import metrics
+
+# Приоритеты запросов: меньше — раньше. Чтения для открытой страницы идут впереди фоновых обновлений и записи
+INTERACTIVE, BACKGROUND, WRITE = 0, 1, 2
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background", WRITE: "write"}
+# Квоты Google Sheets считаются за минуту
+WINDOW_SECONDS = 60
+# Доля бюджета, которую фоновые обновления и запись не занимают: она остается открытым страницам
+INTERACTIVE_RESERVE = 0.2
+
+_current = threading.local()
+
+
+def current_priority():
+    """Приоритет запросов текущего потока (по умолчанию — интерактивный)."""
+    return getattr(_current, "level", INTERACTIVE)
+
+
+@contextmanager
+def priority(level):
+    """Запросы внутри блока идут с приоритетом level (например, фоновое обновление снимков)."""
+    previous = current_priority()
+    _current.level = level
+    try:
+        yield
+    finally:
+        _current.level = previous
+
+
+def bind(fn):
+    """fn для запуска в другом потоке (пул блоков, параллельное чтение) с приоритетом текущего потока."""
+    level = current_priority()
+
+    def run(*args, **kwargs):
+        with priority(level):
+            return fn(*args, **kwargs)
+    return run
+
+
+class QuotaScheduler:
+    """
+    Общий бюджет запросов к Google на минуту (скользящее окно): каждый запрос берет токен,
+    а когда токены за последнюю минуту кончились, ждет в очереди. Очередь упорядочена по приоритету,
+    внутри приоритета — по времени прихода. requests_per_minute = 0 — без ограничения (только метрики).
+    Доля interactive_reserve бюджета доступна только интерактивным запросам, чтобы фоновое обновление
+    не выбирало всю минуту до того, как пользователь откроет страницу.
+    """
+
+    def __init__(self, requests_per_minute=60, interactive_reserve=INTERACTIVE_RESERVE, clock=time.monotonic):
+        self.requests_per_minute = requests_per_minute
+        # Токены в резерве интерактивных; хотя бы один токен остается остальным приоритетам
+        self.reserved = min(int(requests_per_minute * interactive_reserve), max(requests_per_minute - 1, 0))
+        self._clock = clock
+        self._cond = threading.Condition()
+        # Время выдачи токенов за последнее окно
+        self._granted = deque()
+        # Очередь ожидающих: куча (приоритет, номер прихода)
+        self._waiting = []
+        self._tickets = itertools.count()
+
+    def _expire(self, now):
+        while self._granted and self._granted[0] <= now - WINDOW_SECONDS:
+            self._granted.popleft()
+
+    def _limit(self, level):
+        """Сколько токенов за окно может быть занято, чтобы запрос уровня level еще получил свой."""
+        return self.requests_per_minute - (0 if level == INTERACTIVE else self.reserved)
+
+    def acquire(self, level=None):
+        """Берет токен (ждет в очереди, если бюджет минуты исчерпан). Возвращает время ожидания в секундах."""
+        level = current_priority() if level is None else level
+        name = PRIORITY_NAMES.get(level, str(level))
+        started = self._clock()
+        queued = False
+        with self._cond:
+            ticket = (level, next(self._tickets))
+            heapq.heappush(self._waiting, ticket)
+            while True:
+                now = self._clock()
+                self._expire(now)
+                limit = self._limit(level)
+                budget_left = not self.requests_per_minute or len(self._granted) < limit
+                if self._waiting[0] == ticket and budget_left:
+                    break
+                queued = True
+                # Первый в очереди ждет, пока истечет столько токенов, чтобы занятых стало меньше его лимита;
+                # остальные — своей очереди (интерактивный запрос встает в голову очереди и берет резерв)
+                timeout = None
+                if self._waiting[0] == ticket:
+                    timeout = self._granted[len(self._granted) - limit] + WINDOW_SECONDS - now
+                self._cond.wait(timeout)
+            heapq.heappop(self._waiting)
+            self._granted.append(now)
+            # Следующий в очереди проверяет, хватает ли ему бюджета
+            self._cond.notify_all()
+        waited = self._clock() - started
+        metrics.observe("portal_quota_wait_seconds", waited, priority=name)
+        if queued:
+            metrics.inc("portal_quota_queued_total", priority=name)
+        return waited
+
+    @contextmanager
+    def request(self, method, level=None, **labels):
+        """Один запрос к Google API: токен из бюджета, затем счетчики и длительность (metrics.api_call)."""
+        self.acquire(level)
+        with metrics.api_call(method, **labels):
+            yield
+
+    def stats(self):
+        """Бюджет, резерв интерактивных, израсходовано за последнюю минуту и глубина очереди по приоритетам."""
+        with self._cond:
+            self._expire(self._clock())
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for level, _ in self._waiting:
+                name = PRIORITY_NAMES.get(level, str(level))
+                depth[name] = depth.get(name, 0) + 1
+            return {"budget": self.requests_per_minute, "reserved": self.reserved, "used": len(self._granted),
+                    "queue_depth": depth}
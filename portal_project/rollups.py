@@ -0,0 +1,66 @@
+# rollups.py
+import pandas as pd
+
+from indexes import SalesIndex
+
+# На странице Team из имени продавца убираются пробелы и дефисы
+TEAM_STRIP_PATTERN = r'[\s-]'
+
+
+def member_login(username):
+    """Логин участника команды в том виде, в каком его ищут в колонке продавца."""
+    return username.split('@')[0].lower()
+
+
+class SheetRollupSource:
+    """Лист для сводки: индекс продавцов + колонки, по которым считаются показатели."""
+
+    def __init__(self, sales: pd.Series, values: pd.Series = None):
+        self.index = SalesIndex(sales, TEAM_STRIP_PATTERN)
+        self.values = None if values is None else values.to_numpy()
+
+    def rows_for(self, logins):
+        return self.index.rows_for(logins)
+
+
+def _group_kpis(logins, overdue=None, customers=None, bonuses=None):
+    """Показатели одной группы логинов (участник или команда); строки каждой записи считаются один раз."""
+    kpis = {}
+    if overdue is not None:
+        rows = overdue.rows_for(logins)
+        totals = pd.Series(overdue.values[rows], dtype="float64")
+        kpis["Overdue Total"] = float(totals.sum())
+        kpis["Overdue Count"] = len(rows)
+    if customers is not None:
+        rows = customers.rows_for(logins)
+        kpis["Customers"] = len(rows)
+        if customers.values is not None:
+            for status, count in pd.Series(customers.values[rows]).value_counts().items():
+                if str(status).strip():
+                    kpis[f"Customers: {status}"] = int(count)
+    if bonuses is not None:
+        rows = bonuses.rows_for(logins)
+        kpis["Bonuses This Month"] = int(bonuses.values[rows].sum())
+    return kpis
+
+
+def build_kpi_rollup(teams, overdue=None, customers=None, bonuses=None):
+    """
+    Сводка по участникам и командам: суммы и количество просрочек, клиенты по статусам,
+    бонусы за текущий месяц. teams — {команда: [логины]} из secrets["teams"][компания].
+    Возвращает (members, teams): DataFrame с индексом по логину и по команде.
+    """
+    members = sorted({username for team_members in teams.values() for username in team_members})
+    member_rows = {
+        username: _group_kpis([member_login(username)], overdue, customers, bonuses) for username in members
+    }
+    team_rows = {
+        team_name: _group_kpis([member_login(username) for username in team_members], overdue, customers, bonuses)
+        for team_name, team_members in teams.items()
+    }
+    members_df = pd.DataFrame.from_dict(member_rows, orient="index").fillna(0)
+    teams_df = pd.DataFrame.from_dict(team_rows, orient="index").fillna(0)
+    for df in (members_df, teams_df):
+        count_cols = [col for col in df.columns if col != "Overdue Total"]
+        df[count_cols] = df[count_cols].astype(int)
+    return members_df, teams_df
@@ -0,0 +1,91 @@
+# single_flight.py
+import threading
+from concurrent.futures import Future
+
+# Результат, которого нет в ответе пакетной загрузки (лист не прочитался)
+_MISSING = object()
+
+
+class SingleFlight:
+    """
+    Схлопывание одинаковых загрузок: пока по ключу идет загрузка, остальные вызовы ждут
+    ее результат, а не запускают свою. Так одновременные промахи нескольких сессий
+    по одному листу дают один запрос к Google вместо десятка.
+    """
+
+    def __init__(self, on_coalesced=None):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        # on_coalesced(ключ) — для метрик: вызов дождался чужой загрузки
+        self._on_coalesced = on_coalesced
+        self.executed = 0
+        self.coalesced = 0
+
+    def _claim(self, keys):
+        """Делит ключи на свои (загружает этот вызов) и чужие (ждем уже идущую загрузку)."""
+        own, waiting = {}, {}
+        with self._lock:
+            for key in keys:
+                future = self._in_flight.get(key)
+                if future is None:
+                    own[key] = self._in_flight[key] = Future()
+                else:
+                    waiting[key] = future
+            self.executed += len(own)
+            self.coalesced += len(waiting)
+        if self._on_coalesced:
+            for key in waiting:
+                self._on_coalesced(key)
+        return own, waiting
+
+    def _release(self, own, results=None, error=None):
+        with self._lock:
+            for key in own:
+                self._in_flight.pop(key, None)
+        for key, future in own.items():
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(results.get(key, _MISSING))
+
+    def do(self, key, fn):
+        """Результат fn() по ключу; одновременные вызовы с тем же ключом получают тот же результат или ту же ошибку."""
+        own, waiting = self._claim([key])
+        if waiting:
+            return waiting[key].result()
+        try:
+            result = fn()
+        except BaseException as e:
+            self._release(own, error=e)
+            raise
+        self._release(own, {key: result})
+        return result
+
+    def do_many(self, keys, fn_many):
+        """
+        Пакетный вариант: fn_many(ключи) -> {ключ: результат} вызывается только для ключей,
+        которые еще никто не загружает, остальные ждут чужие загрузки.
+        Возвращает {ключ: результат}; ключи, которые не загрузились, в ответ не попадают.
+        """
+        own, waiting = self._claim(list(dict.fromkeys(keys)))
+        results = {}
+        if own:
+            try:
+                results = dict(fn_many(list(own)))
+            except BaseException as e:
+                self._release(own, error=e)
+                raise
+            self._release(own, results)
+        for key, future in waiting.items():
+            try:
+                result = future.result()
+            except Exception:
+                continue
+            if result is not _MISSING:
+                results[key] = result
+        return {key: results[key] for key in keys if key in results}
+
+    def stats(self):
+        """Сколько загрузок выполнено и сколько вызовов дождались чужой загрузки."""
+        with self._lock:
+            return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
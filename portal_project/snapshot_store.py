@@ -0,0 +1,178 @@
+# snapshot_store.py
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from urllib.parse import quote
+
+import pandas as pd
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+# Снимки лежат рядом с приложением и переживают перезапуск сервера
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".snapshots")
+
+
+def _snapshot_path(spreadsheet_id, worksheet_name):
+    """Путь к файлу снимка для конкретного листа конкретной таблицы."""
+    return os.path.join(SNAPSHOT_DIR, quote(str(spreadsheet_id), safe=''), f"{quote(worksheet_name, safe='')}.arrow")
+
+
+def _tmp_path(path):
+    """Временный файл для атомарной записи: свой у каждого потока, иначе параллельные записи мешают друг другу."""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def save_snapshot(spreadsheet_id, worksheet_name, all_values, fetched_at=None, partial=False):
+    """
+    Сохраняет значения листа (как их вернул get_all_values) в колоночный Arrow-файл.
+    Заголовок хранится в метаданных, потому что в листах бывают дубликаты колонок.
+    partial=True — в снимке только первые строки большого листа, остальные еще загружаются.
+    Если данные не изменились, файл не переписывается и версия (fetched_at) остается прежней —
+    кэши производных данных не сбрасываются; время сверки с Google пишется отдельно (read_checked_at).
+    Возвращает время загрузки (fetched_at) сохраненного снимка.
+    """
+    fetched_at = time.time() if fetched_at is None else fetched_at
+    content_hash = hashlib.sha1(json.dumps(all_values, ensure_ascii=False).encode("utf-8")).hexdigest()
+    path = _snapshot_path(spreadsheet_id, worksheet_name)
+    current = _read_metadata(path)
+    if (not partial and current is not None and current.get(b"partial") != b"1"
+            and current.get(b"content_hash") == content_hash.encode("utf-8")):
+        current_fetched_at = float(current.get(b"fetched_at", b"0").decode("utf-8"))
+        save_sidecar(spreadsheet_id, worksheet_name, "checked",
+                     {"fetched_at": current_fetched_at, "checked_at": fetched_at})
+        return current_fetched_at
+
+    header = list(all_values[0]) if all_values else []
+    rows = all_values[1:] if all_values else []
+
+    columns = {}
+    for i in range(len(header)):
+        columns[f"c{i}"] = pa.array([row[i] if i < len(row) else "" for row in rows], type=pa.string())
+
+    metadata = {
+        "worksheet": worksheet_name,
+        "header": json.dumps(header, ensure_ascii=False),
+        "fetched_at": repr(fetched_at),
+        "content_hash": content_hash,
+        # Число строк листа (с заголовком): по нему решается, читать ли лист блоками
+        "row_count": str(len(all_values)),
+    }
+    if partial:
+        metadata["partial"] = "1"
+    table = pa.table(columns, metadata=metadata) if columns else pa.table({}, metadata=metadata)
+
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Пишем во временный файл и атомарно подменяем, чтобы читатели не увидели половину снимка
+        tmp_path = _tmp_path(path)
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Не удалось сохранить снимок листа '%s': %s", worksheet_name, e)
+    return fetched_at
+
+
+def load_snapshot(spreadsheet_id, worksheet_name):
+    """
+    Читает снимок листа с диска через memory-map.
+    Возвращает (DataFrame, fetched_at) или (None, None), если снимка нет или он поврежден.
+    У частичного снимка в df.attrs["partial"] стоит True.
+    """
+    path = _snapshot_path(spreadsheet_id, worksheet_name)
+    if not os.path.exists(path):
+        return None, None
+    try:
+        with pa.memory_map(path, "r") as source:
+            table = pa.ipc.open_file(source).read_all()
+        metadata = table.schema.metadata or {}
+        header = json.loads(metadata.get(b"header", b"[]").decode("utf-8"))
+        fetched_at = float(metadata.get(b"fetched_at", b"0").decode("utf-8"))
+    except (OSError, ValueError, pa.ArrowException) as e:
+        logger.warning("Снимок листа '%s' не читается, будет загружен заново: %s", worksheet_name, e)
+        return None, None
+
+    if not header:
+        return pd.DataFrame(), fetched_at
+    df = table.to_pandas()
+    df.columns = header
+    if metadata.get(b"partial") == b"1":
+        df.attrs["partial"] = True
+    return df, fetched_at
+
+
+def _read_metadata(path):
+    """Метаданные снимка без чтения данных. None, если снимка нет или он поврежден."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with pa.memory_map(path, "r") as source:
+            return pa.ipc.open_file(source).schema.metadata or {}
+    except (OSError, pa.ArrowException):
+        return None
+
+
+def read_fetched_at(spreadsheet_id, worksheet_name):
+    """Быстро читает только время загрузки снимка (без данных). None, если снимка нет."""
+    metadata = _read_metadata(_snapshot_path(spreadsheet_id, worksheet_name))
+    if metadata is None:
+        return None
+    try:
+        return float(metadata.get(b"fetched_at", b"0").decode("utf-8"))
+    except ValueError:
+        return None
+
+
+def read_row_count(spreadsheet_id, worksheet_name):
+    """Число строк листа (с заголовком) в полном снимке. None, если снимка нет или он частичный."""
+    metadata = _read_metadata(_snapshot_path(spreadsheet_id, worksheet_name))
+    if metadata is None or metadata.get(b"partial") == b"1" or b"row_count" not in metadata:
+        return None
+    try:
+        return int(metadata[b"row_count"].decode("utf-8"))
+    except ValueError:
+        return None
+
+
+def read_checked_at(spreadsheet_id, worksheet_name):
+    """
+    Когда данные текущего снимка последний раз сверялись с Google (не раньше fetched_at).
+    По нему считается возраст данных. None, если снимка нет.
+    """
+    fetched_at = read_fetched_at(spreadsheet_id, worksheet_name)
+    if fetched_at is None:
+        return None
+    checked = load_sidecar(spreadsheet_id, worksheet_name, "checked")
+    if checked and checked.get("fetched_at") == fetched_at:
+        return max(fetched_at, checked.get("checked_at", fetched_at))
+    return fetched_at
+
+
+def save_sidecar(spreadsheet_id, worksheet_name, kind, payload):
+    """Сохраняет производные данные снимка (JSON) рядом с ним, чтобы не пересчитывать их после перезапуска."""
+    path = f"{_snapshot_path(spreadsheet_id, worksheet_name)}.{kind}.json"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = _tmp_path(path)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Не удалось сохранить '%s' для листа '%s': %s", kind, worksheet_name, e)
+
+
+def load_sidecar(spreadsheet_id, worksheet_name, kind):
+    """Читает производные данные снимка. None, если их нет или файл поврежден."""
+    path = f"{_snapshot_path(spreadsheet_id, worksheet_name)}.{kind}.json"
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,60 @@
+# styling.py
+import re
+
+import numpy as np
+import pandas as pd
+
+# Правила подсветки строк: тип правила, колонка задается страницей, значения — CSS для всей строки
+ROW_STYLE_RULES = {
+    # Overdue: точное совпадение статуса
+    "overdue_status": ("equals", {
+        "blacklist": "background-color: black; color: white;",
+        "on hold": "background-color: lightcoral; color: black;",
+        "claimed": "background-color: lightcoral; color: black;",
+    }),
+    # Customers: те же статусы, но мягче по цвету
+    "customers_status": ("equals", {
+        "blacklist": "background-color: #555555; color: white;",
+        "on hold": "background-color: #FFCCCB; color: black;",
+        "claimed": "background-color: #FFCCCB; color: black;",
+    }),
+    # Bonus: ключевые слова в колонке результата
+    "bonus_result": ("contains", {
+        "second part?": "background-color: #FFCCCB; color: #721c24;",
+        "ops need to fix": "background-color: #FFCCCB; color: #721c24;",
+        "error": "background-color: #FFCCCB; color: #721c24;",
+        "we or ops need fix": "background-color: #FFCCCB; color: #721c24;",
+    }),
+}
+
+
+def compute_row_styles(df: pd.DataFrame, rule_name, column) -> pd.Series:
+    """
+    Векторно считает CSS для каждой строки по правилу из ROW_STYLE_RULES.
+    Возвращает Series, выровненный по df.index ('' — строка без подсветки).
+    """
+    if column not in df.columns:
+        return pd.Series('', index=df.index)
+    match_type, styles = ROW_STYLE_RULES[rule_name]
+    values = df[column].astype(str).str.strip().str.lower()
+    if match_type == "equals":
+        return values.map(styles).fillna('')
+
+    result = pd.Series('', index=df.index)
+    # Идем в обратном порядке, чтобы при нескольких совпадениях побеждало первое правило
+    for keyword, style in reversed(list(styles.items())):
+        result = result.mask(values.str.contains(re.escape(keyword), regex=True), style)
+    return result
+
+
+def style_rows(df: pd.DataFrame, row_styles):
+    """
+    Применяет готовые стили строк одной матрицей (Styler.apply с axis=None) вместо функции на каждую строку.
+    Если подсвечивать нечего, возвращает таблицу без Styler, чтобы не сериализовать пустые стили.
+    """
+    row_styles = np.asarray(row_styles, dtype=object)
+    if len(df) == 0 or not (row_styles != '').any():
+        return df
+    matrix = np.repeat(row_styles[:, None], len(df.columns), axis=1)
+    styles_df = pd.DataFrame(matrix, index=df.index, columns=df.columns)
+    return df.style.apply(lambda _: styles_df, axis=None)
@@ -1,9 +1,25 @@
 # utils.py
+import time
+import logging
+from datetime import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import streamlit as st
 import gspread
 import pandas as pd
 from google.oauth2.service_account import Credentials
 
+import metrics
+import quota
+import snapshot_store
+from indexes import SalesIndex, LoginMatcher, SheetRowIndex, SearchIndex, MonthPartitions
+from write_queue import AckQueue
+from single_flight import SingleFlight
+from circuit_breaker import CircuitBreaker, CircuitOpenError, OPEN
+from styling import compute_row_styles
+from rollups import SheetRollupSource, build_kpi_rollup
+
 import requests
 from streamlit_lottie import st_lottie
 
@@ -13,7 +29,7 @@ def load_lottieurl(url: str):
         return None
     return r.json()
 
-# --- Блок 1: Подключение к Google (без изменений) ---
+# --- Блок 1: Подключение к Google и общий бюджет запросов ---
 @st.cache_resource(ttl=3600, show_spinner=False)
 def get_gspread_client():
     """Подключается к Google API с использованием учетных данных из Streamlit Secrets."""
@@ -31,41 +47,472 @@ def get_gspread_client():
         st.error(f"Ошибка авторизации в Google: Проверьте ваш secrets.toml. Детали: {e}")
         return None
 
-@st.cache_resource(ttl=600, show_spinner=False)
+@st.cache_resource(show_spinner=False)
+def get_quota_scheduler():
+    """
+    Общий для процесса планировщик запросов к Google: через него идут все чтения и записи.
+    Бюджет — [quota] requests_per_minute (по умолчанию QUOTA_REQUESTS_PER_MINUTE, 0 — без ограничения),
+    доля для открытых страниц — [quota] interactive_reserve (по умолчанию quota.INTERACTIVE_RESERVE).
+    """
+    quota_settings = st.secrets.get("quota", {})
+    scheduler = quota.QuotaScheduler(int(quota_settings.get("requests_per_minute", QUOTA_REQUESTS_PER_MINUTE)),
+                                     float(quota_settings.get("interactive_reserve", quota.INTERACTIVE_RESERVE)))
+    metrics.gauge("portal_quota_queue_depth",
+                  lambda: [({"priority": name}, depth) for name, depth in scheduler.stats()["queue_depth"].items()])
+    metrics.gauge("portal_quota_used_requests", lambda: [({}, scheduler.stats()["used"])])
+    metrics.gauge("portal_quota_budget_requests", lambda: [({}, scheduler.requests_per_minute)])
+    return scheduler
+
+# Подмена Google-таблицы объектом с тем же интерфейсом (бенчмарки и нагрузочные тесты, см. bench/fake_sheets.py)
+_spreadsheet_override = None
+
+def use_spreadsheet(spreadsheet):
+    """Подключает вместо Google-таблицы другой объект с тем же интерфейсом; None — вернуть Google."""
+    global _spreadsheet_override
+    _spreadsheet_override = spreadsheet
+
+class _SheetsConnection:
+    """
+    Google-таблица по ID из secrets. Снимки читаются только по id, поэтому после перезапуска
+    страница не ждет Google; сама таблица открывается при первом запросе к API (загрузка, обновление, запись).
+    """
+
+    def __init__(self, spreadsheet_id):
+        self.id = spreadsheet_id
+        self._spreadsheet = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        with self._lock:
+            if self._spreadsheet is None:
+                client = get_gspread_client()
+                if client is None:
+                    raise RuntimeError("нет подключения к Google API, проверьте gcp_service_account в secrets")
+                with get_quota_scheduler().request("open_by_key"):
+                    self._spreadsheet = client.open_by_key(self.id)
+            return self._spreadsheet
+
+    def __getattr__(self, name):
+        # Сюда попадают только атрибуты gspread-таблицы (id свой). Чтения обращаются к ним внутри _google_call,
+        # поэтому неудачное открытие считается сбоем предохранителя, а при разомкнутом не повторяется
+        return getattr(self._open(), name)
+
+@st.cache_resource(show_spinner=False)
+def _sheets_connection(spreadsheet_id):
+    """Одно подключение к таблице на процесс."""
+    return _SheetsConnection(spreadsheet_id)
+
 def get_spreadsheet():
-    """Открывает Google-таблицу по ее ID из Streamlit Secrets."""
+    """Google-таблица по ее ID из Streamlit Secrets (открывается в Google только при первом запросе к API)."""
+    if _spreadsheet_override is not None:
+        return _spreadsheet_override
     try:
-        client = get_gspread_client()
-        if client is None: return None
         spreadsheet_id = st.secrets["connections"]["spreadsheet_id"]
-        spreadsheet = client.open_by_key(spreadsheet_id)
-        return spreadsheet
     except Exception as e:
-        st.error(f"Не удалось открыть Google-таблицу. Проверьте spreadsheet_id и права доступа для робота. Ошибка: {e}")
+        st.error(f"Не найден spreadsheet_id в разделе [connections] Streamlit Secrets. Ошибка: {e}")
         return None
+    return _sheets_connection(spreadsheet_id)
+
+# --- Блок 2: Загрузка данных (через локальное хранилище снимков) ---
+# Снимок старше этого возраста отдается сразу, но обновляется в фоне
+SNAPSHOT_MAX_AGE = 120  # секунд
+# Как часто плановый поток обновляет все листы (можно переопределить в [refresher] в secrets)
+REFRESH_INTERVAL = 60  # секунд
+# Сколько версий снимков держат кэши производных данных: по одной на настроенный лист с запасом.
+# Версия меняется только вместе с данными, а старые версии не используются и вытесняются первыми
+SNAPSHOT_CACHE_ENTRIES = 16
+# Результаты конвейера страниц: на лист их несколько (компания, период, продавцы, поиск)
+PIPELINE_CACHE_ENTRIES = 64
+# Сколько листов читать одновременно, если batch-запрос не сработал
+BATCH_FALLBACK_WORKERS = 4
+# Общий лист уведомлений (счетчики непрочитанных)
+NOTIFICATIONS_WORKSHEET = "Notifications"
+# Листы длиннее стольких строк читаются блоками параллельно (0 — выключено; [refresher] chunk_rows)
+CHUNK_ROWS = 5000
+CHUNK_WORKERS = 4
+# Бюджет запросов к Google в минуту: квота Sheets на одного пользователя (сервисный аккаунт) — 60 чтений
+# и 60 записей в минуту, общий бюджет держим не выше квоты чтений
+QUOTA_REQUESTS_PER_MINUTE = 60
+# После стольких сбоев Google подряд чтения встают на паузу: от BASE до MAX секунд, с ростом вдвое
+BREAKER_FAILURES = 3
+BREAKER_BASE_DELAY = 5  # секунд
+BREAKER_MAX_DELAY = 300  # секунд
+
+logger = logging.getLogger(__name__)
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+_missing_worksheets = set()
+# (таблица, лист) -> Future с первым блоком идущего блочного чтения
+_chunked_in_flight = {}
+_chunk_pool = ThreadPoolExecutor(max_workers=CHUNK_WORKERS, thread_name_prefix="sheet-chunks")
+# Одна загрузка листа на (таблица, лист): одновременные промахи ждут ее результат (см. _fetch_once)
+_fetches = SingleFlight(on_coalesced=lambda key: metrics.inc("portal_fetch_coalesced_total", worksheet=key[1]))
+
+def _on_breaker_state(state):
+    metrics.inc("portal_circuit_transitions_total", state=state)
+    if state == OPEN:
+        logger.warning("Google Sheets недоступен, чтения на паузе: %s", _breaker.last_error)
+
+# Предохранитель всех чтений из Google: пока он разомкнут, страницы живут на последних снимках
+_breaker = CircuitBreaker(BREAKER_FAILURES, BREAKER_BASE_DELAY, BREAKER_MAX_DELAY, on_state_change=_on_breaker_state)
+
+def _is_google_outage(error):
+    """Сбой на стороне Google (квота, 5xx, сеть), а не ошибка запроса: только такие размыкают предохранитель."""
+    if isinstance(error, (gspread.exceptions.WorksheetNotFound, gspread.exceptions.SpreadsheetNotFound)):
+        return False
+    if isinstance(error, gspread.exceptions.APIError):
+        return error.code in (-1, 429) or error.code >= 500
+    return True
+
+def _google_call(method, worksheet_name, fn):
+    """Чтение из Google через предохранитель; пока он разомкнут — CircuitOpenError без запроса."""
+    def timed():
+        with get_quota_scheduler().request(method, worksheet=worksheet_name):
+            return fn()
+    try:
+        return _breaker.call(timed, is_failure=_is_google_outage)
+    except CircuitOpenError:
+        metrics.inc("portal_circuit_rejected_total", method=method)
+        raise
+
+def google_status():
+    """Состояние чтений из Google для страниц: {"state", "retry_in", "last_error"}."""
+    return {"state": _breaker.state, "retry_in": _breaker.retry_in(), "last_error": _breaker.last_error}
+
+def _chunk_rows():
+    return int(st.secrets.get("refresher", {}).get("chunk_rows", CHUNK_ROWS) or 0)
+
+def _fetch_and_store(spreadsheet, worksheet_name):
+    """Читает лист из Google и сохраняет его снимок на диск (большие листы — блоками, см. _fetch_chunked)."""
+    worksheet = _google_call("worksheet", worksheet_name, lambda: spreadsheet.worksheet(worksheet_name))
+    chunk_rows = _chunk_rows()
+    # Размер сетки включает пустые строки, поэтому решаем по числу строк последнего снимка, а сетка — если его нет
+    data_rows = snapshot_store.read_row_count(spreadsheet.id, worksheet_name)
+    if data_rows is None:
+        data_rows = worksheet.row_count
+    if chunk_rows and data_rows > chunk_rows:
+        return _fetch_chunked(spreadsheet, worksheet_name, data_rows, worksheet.row_count, chunk_rows)
+    # Версия снимка — момент запроса, а не ответа: запись, закончившаяся позже, в снимок могла не попасть
+    started_at = time.time()
+    all_values = _google_call("get_all_values", worksheet_name, worksheet.get_all_values)
+    snapshot_store.save_snapshot(spreadsheet.id, worksheet_name, all_values, fetched_at=started_at)
+    return all_values
+
+def _a1_sheet_range(worksheet_name):
+    """Имя листа в виде A1-диапазона (кавычки нужны для имен с пробелами)."""
+    return "'" + worksheet_name.replace("'", "''") + "'"
+
+def _fetch_block(spreadsheet, worksheet_name, a1_range):
+    return _google_call("values_get", worksheet_name, lambda: spreadsheet.values_get(a1_range)).get("values", [])
+
+def _join_blocks(blocks, bounds):
+    """
+    Склеивает блоки строк в значения листа, как их вернул бы get_all_values.
+    Google не отдает пустые строки в конце диапазона, поэтому блоки добиваются до своей длины,
+    а пустые строки в конце всего листа отрезаются.
+    """
+    all_values = []
+    for block, (start, end) in zip(blocks, bounds):
+        all_values.extend(block)
+        all_values.extend([] for _ in range(end - start + 1 - len(block)))
+    while all_values and not any(all_values[-1]):
+        all_values.pop()
+    return all_values
+
+def _chunk_bounds(data_rows, grid_rows, chunk_rows):
+    """
+    Границы блоков (первая и последняя строка) по chunk_rows строк данных.
+    Последний блок идет до конца сетки: строки, добавленные после снимка, тоже будут прочитаны.
+    """
+    bounds = [(start, min(start + chunk_rows - 1, data_rows)) for start in range(1, data_rows + 1, chunk_rows)]
+    bounds[-1] = (bounds[-1][0], max(bounds[-1][1], grid_rows))
+    return bounds
+
+def _fetch_chunked(spreadsheet, worksheet_name, data_rows, grid_rows, chunk_rows):
+    """
+    Читает большой лист блоками по chunk_rows строк в несколько потоков.
+    Если снимка листа еще нет, первый блок (с заголовком) сразу сохраняется частичным снимком —
+    страница показывает первые строки, а полный снимок сохраняется в фоне, когда придут остальные блоки.
+    Возвращает значения, которые уже сохранены (весь лист или первый блок).
+    """
+    key = (spreadsheet.id, worksheet_name)
+    with _refreshing_lock:
+        in_flight = _chunked_in_flight.get(key)
+    if in_flight is not None:
+        return in_flight.result()
+
+    sheet_range = _a1_sheet_range(worksheet_name)
+    bounds = _chunk_bounds(data_rows, grid_rows, chunk_rows)
+    started_at = time.time()
+    futures = [_chunk_pool.submit(quota.bind(_fetch_block), spreadsheet, worksheet_name, f"{sheet_range}!{start}:{end}") for start, end in bounds]
+    progressive = snapshot_store.read_fetched_at(spreadsheet.id, worksheet_name) is None
+    if not progressive:
+        # Обновление существующего снимка: частичный снимок не должен заменить полный
+        all_values = _join_blocks([future.result() for future in futures], bounds)
+        snapshot_store.save_snapshot(spreadsheet.id, worksheet_name, all_values, fetched_at=started_at)
+        return all_values
+
+    with _refreshing_lock:
+        _chunked_in_flight[key] = futures[0]
+    try:
+        first_block = _join_blocks([futures[0].result()], bounds[:1])
+    except Exception:
+        with _refreshing_lock:
+            _chunked_in_flight.pop(key, None)
+        raise
+    snapshot_store.save_snapshot(spreadsheet.id, worksheet_name, first_block, fetched_at=started_at, partial=True)
+
+    def finish():
+        try:
+            all_values = _join_blocks([future.result() for future in futures], bounds)
+            # Блоки запрошены не раньше started_at; версия чуть новее частичной, чтобы страницы ее увидели
+            snapshot_store.save_snapshot(spreadsheet.id, worksheet_name, all_values, fetched_at=started_at + 0.001)
+        except Exception as e:
+            # Частичный снимок остается и будет заменен плановым обновлением
+            logger.warning("Блочное чтение листа '%s' не завершилось: %s", worksheet_name, e)
+        finally:
+            with _refreshing_lock:
+                _chunked_in_flight.pop(key, None)
+
+    threading.Thread(target=finish, name=f"chunks-{worksheet_name}", daemon=True).start()
+    return first_block
+
+def _fetch_and_store_many(spreadsheet, worksheet_names):
+    """
+    Читает несколько листов за один запрос values_batch_get и сохраняет снимки.
+    Если batch-запрос не прошел (например, одного листа нет), параллельно читает листы по одному.
+    Возвращает словарь {имя листа: значения}; листы с ошибкой в него не попадают.
+    """
+    worksheet_names = list(worksheet_names)
+    results = {}
+    if _breaker.is_open():
+        # Google на паузе: снимки остаются как есть, запросов не отправляем
+        return results
+    # Листы, которые по последнему снимку большие, читаются блоками отдельно от batch-запроса
+    # (число строк хранится в снимке, поэтому известно и сразу после перезапуска)
+    chunk_rows = _chunk_rows()
+    large = [name for name in worksheet_names
+             if chunk_rows and (snapshot_store.read_row_count(spreadsheet.id, name) or 0) > chunk_rows]
+    for name in large:
+        _fetch_into(results, spreadsheet, name)
+    worksheet_names = [name for name in worksheet_names if name not in large]
+    if not worksheet_names:
+        return results
+    if len(worksheet_names) == 1:
+        _fetch_into(results, spreadsheet, worksheet_names[0])
+        return results
+
+    try:
+        ranges = [_a1_sheet_range(name) for name in worksheet_names]
+        fetched_at = time.time()
+        response = _google_call("values_batch_get", "+".join(worksheet_names), lambda: spreadsheet.values_batch_get(ranges))
+        value_ranges = response.get("valueRanges", [])
+        for name, value_range in zip(worksheet_names, value_ranges):
+            all_values = value_range.get("values", [])
+            snapshot_store.save_snapshot(spreadsheet.id, name, all_values, fetched_at=fetched_at)
+            results[name] = all_values
+        return results
+    except Exception as e:
+        if _breaker.is_open():
+            # Сбой Google, а не отдельного листа: чтение по одному только добавило бы запросов
+            logger.warning("Batch-чтение листов %s не удалось, Google на паузе: %s", worksheet_names, e)
+            return results
+        logger.info("Batch-чтение листов %s не удалось, читаем параллельно: %s", worksheet_names, e)
+
+    with ThreadPoolExecutor(max_workers=min(len(worksheet_names), BATCH_FALLBACK_WORKERS)) as pool:
+        for name in worksheet_names:
+            pool.submit(quota.bind(_fetch_into), results, spreadsheet, name)
+    return results
+
+def _fetch_into(results, spreadsheet, worksheet_name):
+    """_fetch_and_store для пакетного чтения: значения кладет в results, ошибку только логирует."""
+    try:
+        results[worksheet_name] = _fetch_and_store(spreadsheet, worksheet_name)
+    except gspread.exceptions.WorksheetNotFound:
+        # Запоминаем, чтобы плановое обновление не ломало batch-запрос каждый раз
+        _missing_worksheets.add((spreadsheet.id, worksheet_name))
+        logger.warning("Лист '%s' не найден в Google-таблице.", worksheet_name)
+    except Exception as e:
+        logger.warning("Не удалось прочитать лист '%s': %s", worksheet_name, e)
+
+def _fetch_once(spreadsheet, worksheet_name):
+    """_fetch_and_store без дублей: если лист уже загружается, ждем ту загрузку и берем ее результат."""
+    return _fetches.do((spreadsheet.id, worksheet_name), lambda: _fetch_and_store(spreadsheet, worksheet_name))
+
+def _fetch_many_once(spreadsheet, worksheet_names):
+    """_fetch_and_store_many без дублей: листы, которые уже загружаются, не запрашиваются повторно."""
+    results = _fetches.do_many(
+        [(spreadsheet.id, name) for name in worksheet_names],
+        lambda keys: {
+            (spreadsheet.id, name): values
+            for name, values in _fetch_and_store_many(spreadsheet, [name for _, name in keys]).items()
+        },
+    )
+    return {name: values for (_, name), values in results.items()}
+
+def _refresh_in_background(spreadsheet, worksheet_names):
+    """Запускает одно фоновое обновление снимков для листов, которые еще не обновляются."""
+    if isinstance(worksheet_names, str):
+        worksheet_names = [worksheet_names]
+    with _refreshing_lock:
+        claimed = [name for name in worksheet_names if (spreadsheet.id, name) not in _refreshing]
+        _refreshing.update((spreadsheet.id, name) for name in claimed)
+    if not claimed:
+        return
+
+    def worker():
+        try:
+            with quota.priority(quota.BACKGROUND):
+                _fetch_many_once(spreadsheet, claimed)
+        except Exception as e:
+            # В фоновом потоке нет контекста страницы, поэтому только логируем
+            logger.warning("Фоновое обновление листов %s не удалось: %s", claimed, e)
+        finally:
+            with _refreshing_lock:
+                _refreshing.difference_update((spreadsheet.id, name) for name in claimed)
+
+    threading.Thread(target=worker, name=f"refresh-{'+'.join(claimed)}", daemon=True).start()
+
+def configured_worksheets():
+    """Все листы, на которые ссылаются page_settings (всех страниц и компаний), плюс лист уведомлений."""
+    worksheet_names = []
+    for page_config in st.secrets.get("page_settings", {}).values():
+        for company_config in page_config.values():
+            worksheet_name = company_config.get("worksheet") if hasattr(company_config, "get") else None
+            if worksheet_name:
+                worksheet_names.append(worksheet_name)
+    worksheet_names.append(NOTIFICATIONS_WORKSHEET)
+    return list(dict.fromkeys(worksheet_names))
+
+@st.cache_resource(show_spinner=False)
+def start_background_refresher(_spreadsheet):
+    """
+    Один раз на процесс запускает поток, который по расписанию обновляет снимки всех настроенных листов
+    (у которых снимок уже есть). Страницы при этом всегда читают последний удачный снимок и не ждут Google.
+    interval_seconds = 0 выключает плановое обновление (бенчмарки, нагрузочные тесты).
+    """
+    interval = st.secrets.get("refresher", {}).get("interval_seconds", REFRESH_INTERVAL)
+    if not interval:
+        return None
+    worksheet_names = configured_worksheets()
+    # Необязательная выгрузка метрик в файл для textfile-коллектора Prometheus ([metrics] textfile_path)
+    metrics_path = st.secrets.get("metrics", {}).get("textfile_path")
+
+    def worker():
+        while True:
+            now = time.time()
+            due = []
+            for name in worksheet_names:
+                if (_spreadsheet.id, name) in _missing_worksheets:
+                    continue
+                checked_at = snapshot_store.read_checked_at(_spreadsheet.id, name)
+                # Лист без снимка загрузит первая открывшая его страница: с интерактивным приоритетом
+                # и без ожидания остальных листов фонового batch-запроса
+                if checked_at is None:
+                    continue
+                # Пропускаем листы, которые только что обновились по другому пути
+                if now - checked_at >= interval / 2:
+                    due.append(name)
+            with _refreshing_lock:
+                claimed = [name for name in due if (_spreadsheet.id, name) not in _refreshing]
+                _refreshing.update((_spreadsheet.id, name) for name in claimed)
+            try:
+                if claimed:
+                    with quota.priority(quota.BACKGROUND):
+                        _fetch_many_once(_spreadsheet, claimed)
+            except Exception as e:
+                logger.warning("Плановое обновление листов не удалось: %s", e)
+            finally:
+                with _refreshing_lock:
+                    _refreshing.difference_update((_spreadsheet.id, name) for name in claimed)
+            if metrics_path:
+                try:
+                    metrics.write_textfile(metrics_path)
+                except OSError as e:
+                    logger.warning("Не удалось записать метрики в '%s': %s", metrics_path, e)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=worker, name="sheets-refresher", daemon=True)
+    thread.start()
+    return thread
+
+@st.cache_data(ttl=3600, max_entries=SNAPSHOT_CACHE_ENTRIES, show_spinner=False)
+def _load_snapshot_frame(_spreadsheet, worksheet_name, fetched_at):
+    """
+    Читает снимок с диска; ключ кэша включает fetched_at, поэтому новый снимок сразу виден всем.
+    Версия снимка сохраняется в df.attrs и переживает фильтрацию и копирование на страницах.
+    """
+    with metrics.timer("portal_snapshot_load_seconds", worksheet=worksheet_name):
+        df, _ = snapshot_store.load_snapshot(_spreadsheet.id, worksheet_name)
+    df = pd.DataFrame() if df is None else df
+    df.attrs["worksheet"] = worksheet_name
+    df.attrs["fetched_at"] = fetched_at
+    return df
 
-# --- Блок 2: Загрузка данных (без изменений) ---
-@st.cache_data(ttl=60, show_spinner=False)
 def _internal_load_data(_spreadsheet, worksheet_name):
-    """Внутренняя функция для загрузки данных с конкретного листа."""
+    """
+    Внутренняя функция для загрузки данных с конкретного листа.
+    Всегда отдает последний удачный снимок; в Google идет синхронно, только если снимка еще нет.
+    """
     try:
         if _spreadsheet is None:
             return pd.DataFrame() 
-        worksheet = _spreadsheet.worksheet(worksheet_name)
-        all_values = worksheet.get_all_values()
-        if not all_values or len(all_values) < 1:
+        start_background_refresher(_spreadsheet)
+        fetched_at = snapshot_store.read_fetched_at(_spreadsheet.id, worksheet_name)
+        if fetched_at is None:
+            metrics.inc("portal_snapshot_requests_total", worksheet=worksheet_name, result="miss")
+            all_values = _fetch_once(_spreadsheet, worksheet_name)
+            fetched_at = snapshot_store.read_fetched_at(_spreadsheet.id, worksheet_name)
+            if fetched_at is None:
+                # Снимок не сохранился (например, диск только для чтения) — работаем без него
+                if not all_values or len(all_values) < 1:
+                    st.warning(f"Лист '{worksheet_name}' пуст или содержит только заголовок.")
+                    return pd.DataFrame()
+                return pd.DataFrame(all_values[1:], columns=all_values[0])
+        elif time.time() - snapshot_store.read_checked_at(_spreadsheet.id, worksheet_name) > SNAPSHOT_MAX_AGE:
+            # Страховка на случай, если плановый поток отстал
+            metrics.inc("portal_snapshot_requests_total", worksheet=worksheet_name, result="stale")
+            _refresh_in_background(_spreadsheet, worksheet_name)
+        else:
+            metrics.inc("portal_snapshot_requests_total", worksheet=worksheet_name, result="hit")
+
+        df = _load_snapshot_frame(_spreadsheet, worksheet_name, fetched_at)
+        if df.empty and len(df.columns) == 0:
             st.warning(f"Лист '{worksheet_name}' пуст или содержит только заголовок.")
-            return pd.DataFrame()
-        df = pd.DataFrame(all_values[1:], columns=all_values[0])
         return df
     except gspread.exceptions.WorksheetNotFound:
         st.error(f"Лист с именем '{worksheet_name}' не найден в Google-таблице.")
         return pd.DataFrame()
+    except CircuitOpenError as e:
+        # Снимка еще нет, а Google на паузе: не повторяем запрос на каждом перезапуске страницы
+        st.warning(f"Google Sheets временно недоступен: лист '{worksheet_name}' загрузится примерно через {e.retry_in:.0f} с.")
+        return pd.DataFrame()
     except Exception as e:
         st.error(f"Ошибка при чтении данных с листа '{worksheet_name}': {e}")
         return pd.DataFrame()
 
-# --- Блок 3: Функция-диспетчер (без изменений) ---
+def snapshot_updated_since(worksheet_name, fetched_at):
+    """True, если с версии fetched_at у листа появился более новый снимок."""
+    spreadsheet = get_spreadsheet()
+    if spreadsheet is None:
+        return False
+    current = snapshot_store.read_fetched_at(spreadsheet.id, worksheet_name)
+    return current is not None and current > fetched_at
+
+def snapshot_checked_at(df):
+    """
+    Когда данные df последний раз сверялись с Google: версия снимка не меняется, пока данные те же,
+    поэтому возраст данных считается по времени сверки текущего снимка (если df — его версия).
+    """
+    worksheet_name, fetched_at = df.attrs.get("worksheet"), df.attrs.get("fetched_at")
+    spreadsheet = get_spreadsheet()
+    if worksheet_name is None or fetched_at is None or spreadsheet is None:
+        return fetched_at
+    if snapshot_store.read_fetched_at(spreadsheet.id, worksheet_name) != fetched_at:
+        return fetched_at
+    return snapshot_store.read_checked_at(spreadsheet.id, worksheet_name)
+
+# --- Блок 3: Функция-диспетчер и пакетная загрузка снимков ---
 def load_data(*args, **kwargs):
     """Универсальная функция-диспетчер для загрузки данных."""
     if len(args) == 2:
@@ -87,38 +534,599 @@ def load_data(*args, **kwargs):
         st.error("Неверные аргументы для функции load_data.")
         return pd.DataFrame()
 
-# --- Блок 4: Подсчет уведомлений (без изменений) ---
-@st.cache_data(ttl=60, show_spinner=False)
+def _ensure_snapshots(spreadsheet_obj, worksheet_names):
+    """
+    Гарантирует снимки для листов и возвращает {имя листа: fetched_at} (None, если загрузить не удалось).
+    Листы без снимка забираются одним batch-запросом, устаревшие — одним фоновым обновлением.
+    """
+    missing, stale = [], []
+    now = time.time()
+    versions = {}
+    for name in worksheet_names:
+        fetched_at = snapshot_store.read_fetched_at(spreadsheet_obj.id, name)
+        versions[name] = fetched_at
+        if fetched_at is None:
+            missing.append(name)
+        elif now - snapshot_store.read_checked_at(spreadsheet_obj.id, name) > SNAPSHOT_MAX_AGE:
+            stale.append(name)
+        result = "miss" if fetched_at is None else "stale" if name in stale else "hit"
+        metrics.inc("portal_snapshot_requests_total", worksheet=name, result=result)
+
+    if missing:
+        try:
+            _fetch_many_once(spreadsheet_obj, missing)
+        except Exception as e:
+            # Ошибки по отдельным листам покажет _internal_load_data
+            logger.warning("Не удалось загрузить листы %s: %s", missing, e)
+        for name in missing:
+            versions[name] = snapshot_store.read_fetched_at(spreadsheet_obj.id, name)
+    if stale:
+        _refresh_in_background(spreadsheet_obj, stale)
+    return versions
+
+def prefetch_worksheets(worksheet_names, spreadsheet_obj=None):
+    """
+    Готовит снимки нескольких листов одним batch-запросом, не читая их в память.
+    Возвращает {имя листа: fetched_at}.
+    """
+    worksheet_names = list(dict.fromkeys(name for name in worksheet_names if name))
+    if spreadsheet_obj is None:
+        spreadsheet_obj = get_spreadsheet()
+    if spreadsheet_obj is None or not worksheet_names:
+        return {}
+    start_background_refresher(spreadsheet_obj)
+    return _ensure_snapshots(spreadsheet_obj, worksheet_names)
+
+# --- Блок 3.1: Типизированные колонки (разбираются один раз на снимок) ---
+# Типы, которые выводятся из стандартных ключей page_settings; column_types в конфиге их дополняет
+_DEFAULT_COLUMN_TYPES = {"total_col": "money", "month_col": "month", "year_col": "number", "expiry_date_col": "date"}
+
+def sanitize_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Автоматически исправляет дубликаты колонок и убирает лишние пробелы."""
+    cols = list(df.columns)
+    new_cols = []
+    col_counts = {}
+    for col in cols:
+        clean_col = col.strip() if isinstance(col, str) else col
+        if clean_col in col_counts:
+            col_counts[clean_col] += 1
+            new_cols.append(f"{clean_col}_{col_counts[clean_col]}")
+        else:
+            col_counts[clean_col] = 0
+            new_cols.append(clean_col)
+    df.columns = new_cols
+    return df
+
+def column_schema(company_config):
+    """Собирает схему {колонка: тип} для листа из настроек страницы компании."""
+    schema = {}
+    for config_key, column_type in _DEFAULT_COLUMN_TYPES.items():
+        if company_config.get(config_key):
+            schema[company_config[config_key]] = column_type
+    schema.update(company_config.get("column_types", {}))
+    return schema
+
+def _parse_column(series, column_type):
+    """Приводит колонку с отображаемыми строками к нужному типу."""
+    if column_type == "money":
+        cleaned = series.astype(str).str.replace(r'[^\d.-]', '', regex=True)
+        return pd.to_numeric(cleaned, errors='coerce')
+    if column_type in ("number", "month"):
+        return pd.to_numeric(series, errors='coerce')
+    if column_type == "date":
+        return pd.to_datetime(series, errors='coerce')
+    return series
+
+def _build_typed_columns(df, schema):
+    """Разбирает колонки из схемы, которые есть в листе."""
+    df = sanitize_columns(df.copy(deep=False))
+    typed = pd.DataFrame(index=df.index)
+    for column, column_type in schema:
+        if column in df.columns:
+            typed[column] = _parse_column(df[column], column_type)
+    return typed
+
+@st.cache_data(ttl=3600, max_entries=SNAPSHOT_CACHE_ENTRIES, show_spinner=False)
+def _cached_typed_columns(_spreadsheet, worksheet_name, fetched_at, schema):
+    """Типизированные колонки для конкретной версии снимка."""
+    return _build_typed_columns(_load_snapshot_frame(_spreadsheet, worksheet_name, fetched_at), schema)
+
+def load_typed_columns(df, company_config):
+    """
+    Возвращает DataFrame только с типизированными колонками схемы (деньги, месяцы, даты).
+    Индекс совпадает с исходным снимком, поэтому результат выравнивается через .loc[df.index].
+    """
+    schema = tuple(sorted(column_schema(company_config).items()))
+    worksheet_name, fetched_at = df.attrs.get("worksheet"), df.attrs.get("fetched_at")
+    if not schema or worksheet_name is None or fetched_at is None:
+        # Данные не из снимка — разбираем то, что передали
+        return _build_typed_columns(df, schema)
+    typed = _cached_typed_columns(get_spreadsheet(), worksheet_name, fetched_at, schema)
+    return typed.loc[df.index]
+
+@st.cache_data(ttl=3600, max_entries=SNAPSHOT_CACHE_ENTRIES, show_spinner=False)
+def _cached_row_styles(_spreadsheet, worksheet_name, fetched_at, rule_name, column):
+    """Стили строк для конкретной версии снимка."""
+    df = sanitize_columns(_load_snapshot_frame(_spreadsheet, worksheet_name, fetched_at))
+    return compute_row_styles(df, rule_name, column)
+
+def load_row_styles(df, rule_name, column):
+    """
+    CSS подсветки для каждой строки df по правилу из styling.ROW_STYLE_RULES.
+    Считается один раз на снимок и выравнивается по df.index, поэтому вызывать до reset_index.
+    """
+    worksheet_name, fetched_at = df.attrs.get("worksheet"), df.attrs.get("fetched_at")
+    if worksheet_name is None or fetched_at is None:
+        return compute_row_styles(df, rule_name, column)
+    row_styles = _cached_row_styles(get_spreadsheet(), worksheet_name, fetched_at, rule_name, column)
+    return row_styles.reindex(df.index).fillna('')
+
+# --- Блок 3.2: Индекс строк по продавцу (строится один раз на снимок) ---
+def _simple_login(username):
+    """Логин без домена и точек/дефисов — так его ищут в колонке продавца."""
+    return username.split('@')[0].lower().replace('.', '').replace('-', '')
+
+@st.cache_resource(ttl=3600, max_entries=SNAPSHOT_CACHE_ENTRIES, show_spinner=False)
+def _cached_sales_index(_spreadsheet, worksheet_name, fetched_at, sales_col, strip_pattern):
+    """Общий для всех сессий индекс продавцов для конкретной версии снимка."""
+    df = sanitize_columns(_load_snapshot_frame(_spreadsheet, worksheet_name, fetched_at))
+    if sales_col not in df.columns:
+        return None
+    index = SalesIndex(df[sales_col], strip_pattern)
+    # Сразу раскладываем строки по всем настроенным логинам
+    for username in st.secrets.get("users", {}).keys():
+        index.rows_for_login(_simple_login(username))
+    return index
+
+def filter_by_sales(df, sales_col, logins, strip_pattern=r"[ -]"):
+    """
+    Оставляет строки, где очищенное имя продавца содержит любой из логинов.
+    strip_pattern — какие символы убирать из имени продавца перед сравнением.
+    """
+    logins = tuple(login for login in logins if login)
+    index = None
+    worksheet_name, fetched_at = df.attrs.get("worksheet"), df.attrs.get("fetched_at")
+    if worksheet_name is not None and fetched_at is not None:
+        index = _cached_sales_index(get_spreadsheet(), worksheet_name, fetched_at, sales_col, strip_pattern)
+    if index is None:
+        # Данные не из снимка — индекс строится по переданной таблице
+        index = SalesIndex(df[sales_col], strip_pattern)
+        return df.iloc[index.rows_for(logins)]
+
+    return _take_snapshot_rows(df, index.rows_for(logins), index.row_count)
+
+def _take_snapshot_rows(df, rows, row_count):
+    """Выбирает из df строки снимка по их позициям (df может быть уже отфильтрован)."""
+    if df.index.equals(pd.RangeIndex(row_count)):
+        # Таблица не фильтровалась — берем строки напрямую, O(совпадений)
+        return df.iloc[rows]
+    return df[df.index.isin(rows)]
+
+# --- Блок 3.3: Поиск по колонке (индекс строится один раз на снимок) ---
+@st.cache_resource(ttl=3600, max_entries=SNAPSHOT_CACHE_ENTRIES, show_spinner=False)
+def _cached_search_index(_spreadsheet, worksheet_name, fetched_at, column):
+    """Общий для всех сессий поисковый индекс колонки для конкретной версии снимка."""
+    df = sanitize_columns(_load_snapshot_frame(_spreadsheet, worksheet_name, fetched_at))
+    if column not in df.columns:
+        return None
+    return SearchIndex(df[column])
+
+def search_rows(df, column, term, fuzzy=False):
+    """
+    Оставляет строки, где колонка содержит term (без учета регистра).
+    При fuzzy=True и отсутствии точных совпадений возвращает похожие значения (опечатки).
+    Возвращает (DataFrame, признак нечеткого результата).
+    """
+    index = None
+    worksheet_name, fetched_at = df.attrs.get("worksheet"), df.attrs.get("fetched_at")
+    if worksheet_name is not None and fetched_at is not None:
+        index = _cached_search_index(get_spreadsheet(), worksheet_name, fetched_at, column)
+    if index is None:
+        # Данные не из снимка — индекс строится по переданной таблице
+        index = SearchIndex(df[column])
+        rows, is_fuzzy = index.search(term, fuzzy=fuzzy)
+        return df.iloc[rows], is_fuzzy
+    rows, is_fuzzy = index.search(term, fuzzy=fuzzy)
+    return _take_snapshot_rows(df, rows, index.row_count), is_fuzzy
+
+# --- Блок 3.3.1: Разбиение листа по месяцам (один раз на снимок) ---
+def _build_month_partitions(df, month_col, year_col):
+    months = _parse_column(df[month_col], "month")
+    years = _parse_column(df[year_col], "number") if year_col and year_col in df.columns else None
+    return MonthPartitions(months, years)
+
+@st.cache_resource(ttl=3600, max_entries=SNAPSHOT_CACHE_ENTRIES, show_spinner=False)
+def _cached_month_partitions(_spreadsheet, worksheet_name, fetched_at, month_col, year_col):
+    """Общее для всех сессий разбиение строк снимка по (год, месяц)."""
+    df = sanitize_columns(_load_snapshot_frame(_spreadsheet, worksheet_name, fetched_at))
+    if month_col not in df.columns:
+        return MonthPartitions(pd.Series(dtype="float64"))
+    return _build_month_partitions(df, month_col, year_col)
+
+def load_month_periods(company_config):
+    """
+    Периоды (год, месяц), которые есть в листе страницы, от новых к старым.
+    Год — None, если в настройках нет year_col.
+    """
+    worksheet_name, month_col = company_config.get("worksheet"), company_config.get("month_col")
+    spreadsheet = get_spreadsheet()
+    if not worksheet_name or not month_col or spreadsheet is None:
+        return []
+    fetched_at = prefetch_worksheets([worksheet_name], spreadsheet).get(worksheet_name)
+    if fetched_at is None:
+        return []
+    partitions = _cached_month_partitions(spreadsheet, worksheet_name, fetched_at, month_col, company_config.get("year_col"))
+    return partitions.periods()
+
+# --- Блок 3.4: Общий конвейер данных страниц ---
+# Страница описывает, что ей нужно (стадии с параметрами), а каждая стадия кэшируется
+# по (версия снимка, параметры всех стадий до нее включительно). Смена поискового запроса
+# поэтому переиспользует уже отфильтрованные таблицы компании и пользователя.
+# Результаты общие для всех сессий: страницы не должны изменять их на месте.
+def _stage_company(df, filter_col, filter_val, exclude_vals):
+    """Фильтр компании из page_settings: включение по filter_val или исключение exclude_vals."""
+    if filter_col not in df.columns:
+        return df
+    if filter_val:
+        return df[df[filter_col] == filter_val]
+    if exclude_vals:
+        return df[~df[filter_col].isin(exclude_vals)]
+    return df
+
+def _stage_sales(df, sales_col, logins, strip_pattern):
+    """Строки выбранных продавцов (см. filter_by_sales)."""
+    if sales_col not in df.columns:
+        return df.iloc[0:0]
+    return filter_by_sales(df, sales_col, logins, strip_pattern)
+
+def _stage_search(df, column, term, fuzzy):
+    """Поиск по колонке; признак нечеткого результата кладется в attrs["fuzzy_search"]."""
+    if column not in df.columns:
+        return df
+    df, is_fuzzy = search_rows(df, column, term, fuzzy=fuzzy)
+    df.attrs["fuzzy_search"] = is_fuzzy
+    return df
+
+def _stage_period(df, month_col, year_col, year, month):
+    """Строки одного периода из разбиения снимка по месяцам (см. load_month_periods)."""
+    if month_col not in df.columns:
+        return df
+    worksheet_name, fetched_at = df.attrs.get("worksheet"), df.attrs.get("fetched_at")
+    if worksheet_name is None or fetched_at is None:
+        # Данные не из снимка — разбиваем переданную таблицу
+        return df.iloc[_build_month_partitions(df, month_col, year_col).rows_for(year, month)]
+    partitions = _cached_month_partitions(get_spreadsheet(), worksheet_name, fetched_at, month_col, year_col)
+    return _take_snapshot_rows(df, partitions.rows_for(year, month), partitions.row_count)
+
+def _stage_where(df, column, value):
+    """Точное совпадение значения колонки (фильтры из выпадающих списков)."""
+    if column not in df.columns:
+        return df
+    return df[df[column] == value]
+
+def _stage_columns(df, columns):
+    """Краткий вид: только существующие колонки из списка; если ни одной нет — таблица как есть."""
+    existing = [col for col in columns if col in df.columns]
+    return df[existing] if existing else df
+
+PIPELINE_STAGES = {
+    "company": _stage_company,
+    "sales": _stage_sales,
+    "search": _stage_search,
+    "period": _stage_period,
+    "where": _stage_where,
+    "columns": _stage_columns,
+}
+
+def page_stages(company_config, period=None, logins=None, strip_pattern=r"[ -]", search_col=None, search_term="",
+                fuzzy=False, where=None, columns=None):
+    """
+    Собирает описание стадий по настройкам страницы компании.
+    period — (год, месяц) по month_col/year_col; logins=None — без фильтра по продавцу (полный доступ);
+    where — {колонка: значение}.
+    """
+    stages = []
+    filter_col = company_config.get("filter_col")
+    filter_val = company_config.get("filter_val")
+    exclude_vals = company_config.get("exclude_vals")
+    exclude_vals = tuple(exclude_vals) if isinstance(exclude_vals, list) else None
+    if filter_col and (filter_val or exclude_vals):
+        stages.append(("company", (filter_col, filter_val, exclude_vals)))
+    if period is not None and company_config.get("month_col"):
+        # Период выбирается до остальных фильтров: дальше работаем только со строками месяца
+        stages.append(("period", (company_config["month_col"], company_config.get("year_col"), *period)))
+    if logins is not None:
+        logins = tuple(sorted({login for login in logins if login}))
+        stages.append(("sales", (company_config.get("sales_col"), logins, strip_pattern)))
+    if search_col and search_term:
+        stages.append(("search", (search_col, search_term, fuzzy)))
+    for column, value in (where or {}).items():
+        stages.append(("where", (column, value)))
+    if columns:
+        stages.append(("columns", (tuple(columns),)))
+    return tuple(stages)
+
+def _apply_stages(df, stages):
+    for name, params in stages:
+        df = PIPELINE_STAGES[name](df, *params)
+    return df
+
+@st.cache_resource(ttl=3600, max_entries=PIPELINE_CACHE_ENTRIES, show_spinner=False)
+def _run_pipeline(_spreadsheet, worksheet_name, fetched_at, stages):
+    """Результат цепочки стадий для версии снимка; префикс цепочки берется из этого же кэша."""
+    if not stages:
+        return sanitize_columns(_load_snapshot_frame(_spreadsheet, worksheet_name, fetched_at))
+    df = _run_pipeline(_spreadsheet, worksheet_name, fetched_at, stages[:-1])
+    name, params = stages[-1]
+    # Сюда попадаем только при промахе кэша: счетчик показывает, сколько стадий реально пересчитано
+    metrics.inc("portal_pipeline_stage_runs_total", worksheet=worksheet_name, stage=name)
+    with metrics.timer("portal_pipeline_stage_seconds", worksheet=worksheet_name, stage=name):
+        return PIPELINE_STAGES[name](df, *params)
+
+def load_page_frame(company_config, **stage_params):
+    """
+    Таблица страницы после всех стадий конвейера (параметры — как у page_stages).
+    Без снимка (лист не найден, диск только для чтения) стадии выполняются без кэша.
+    """
+    worksheet_name = company_config.get("worksheet")
+    stages = page_stages(company_config, **stage_params)
+    spreadsheet = get_spreadsheet()
+    if not worksheet_name or spreadsheet is None:
+        return pd.DataFrame()
+    metrics.inc("portal_page_frame_requests_total", worksheet=worksheet_name)
+    with metrics.timer("portal_page_frame_seconds", worksheet=worksheet_name):
+        fetched_at = prefetch_worksheets([worksheet_name], spreadsheet).get(worksheet_name)
+        if fetched_at is None:
+            df = load_data(spreadsheet, worksheet_name)
+            return _apply_stages(sanitize_columns(df), stages) if not df.empty else df
+        return _run_pipeline(spreadsheet, worksheet_name, fetched_at, stages)
+
+@st.cache_data(ttl=3600, max_entries=PIPELINE_CACHE_ENTRIES, show_spinner=False)
+def _cached_page_total(_spreadsheet, worksheet_name, fetched_at, stages, column, schema):
+    """Сумма числовой колонки по строкам цепочки стадий для версии снимка."""
+    df = _run_pipeline(_spreadsheet, worksheet_name, fetched_at, stages)
+    typed = _cached_typed_columns(_spreadsheet, worksheet_name, fetched_at, schema)
+    if column not in typed.columns:
+        return 0.0
+    return float(typed.loc[df.index, column].dropna().sum())
+
+def load_page_total(company_config, column, **stage_params):
+    """
+    Итог по числовой колонке (например, total_col) для строк страницы; параметры — как у load_page_frame.
+    Считается один раз на снимок и набор стадий, как сводка _cached_kpi_rollup, а не на каждом перезапуске.
+    """
+    worksheet_name = company_config.get("worksheet")
+    spreadsheet = get_spreadsheet()
+    if not worksheet_name or spreadsheet is None:
+        return 0.0
+    fetched_at = prefetch_worksheets([worksheet_name], spreadsheet).get(worksheet_name)
+    if fetched_at is None:
+        df = load_page_frame(company_config, **stage_params)
+        typed = load_typed_columns(df, company_config)
+        return float(typed[column].dropna().sum()) if column in typed.columns else 0.0
+    schema = tuple(sorted(column_schema(company_config).items()))
+    stages = page_stages(company_config, **stage_params)
+    return _cached_page_total(spreadsheet, worksheet_name, fetched_at, stages, column, schema)
+
+# --- Блок 3.5: Сводные показатели по участникам и командам (один расчет на снимок) ---
+def _rollup_source(_spreadsheet, config, fetched_at, kind, period):
+    """Лист страницы после фильтра компании, упакованный для подсчета сводки (None — считать нечего)."""
+    sales_col = config.get("sales_col")
+    if fetched_at is None or not sales_col:
+        return None
+    df = _run_pipeline(_spreadsheet, config["worksheet"], fetched_at, page_stages(config))
+    if sales_col not in df.columns:
+        return None
+    if kind == "overdue":
+        total_col = config.get("total_col")
+        if not total_col or total_col not in df.columns:
+            return None
+        values = load_typed_columns(df, config)[total_col]
+    elif kind == "customers":
+        status_col = config.get("status_col")
+        values = df[status_col].astype(str).str.strip() if status_col and status_col in df.columns else None
+    else:
+        month_col = config.get("month_col")
+        if not month_col or month_col not in df.columns:
+            return None
+        # Бонусы текущего периода — по тому же разбиению (год, месяц), что и страница Bonus
+        year_col = config.get("year_col")
+        year, month = period
+        partitions = _cached_month_partitions(_spreadsheet, config["worksheet"], fetched_at, month_col, year_col)
+        rows = partitions.rows_for(year if year_col else None, month)
+        values = pd.Series(df.index.isin(rows), index=df.index)
+    return SheetRollupSource(df[sales_col], values)
+
+@st.cache_resource(ttl=3600, max_entries=16, show_spinner=False)
+def _cached_kpi_rollup(_spreadsheet, company_key, versions, period):
+    """Сводка для компании; ключ — версии трех листов и период (год, месяц), поэтому пересчет только при новом снимке."""
+    page_settings = st.secrets.get("page_settings", {})
+    sources = {
+        page_name: _rollup_source(_spreadsheet, page_settings.get(page_name, {}).get(company_key, {}), fetched_at, page_name, period)
+        for page_name, fetched_at in versions
+    }
+    teams = st.secrets.get("teams", {}).get(company_key, {})
+    return build_kpi_rollup(teams, **sources)
+
+def load_kpi_rollup(company_key):
+    """
+    Сводка (members, teams) по продавцам и командам компании: просрочки, клиенты по статусам,
+    бонусы текущего месяца. Выбор участника или команды — поиск по индексу, без пересчета листов.
+    """
+    spreadsheet = get_spreadsheet()
+    page_settings = st.secrets.get("page_settings", {})
+    worksheets = {
+        page_name: page_settings.get(page_name, {}).get(company_key, {}).get("worksheet")
+        for page_name in ("overdue", "customers", "bonuses")
+    }
+    if spreadsheet is None:
+        return pd.DataFrame(), pd.DataFrame()
+    fetched = prefetch_worksheets(worksheets.values(), spreadsheet)
+    versions = tuple((page_name, fetched.get(name) if name else None) for page_name, name in worksheets.items())
+    now = datetime.now()
+    return _cached_kpi_rollup(spreadsheet, company_key, versions, (now.year, now.month))
+
+# --- Блок 4: Подсчет уведомлений (один расчет на снимок для всех пользователей) ---
+def _snapshot_version(_spreadsheet, worksheet_name):
+    """Версия (fetched_at) текущего снимка листа; при отсутствии снимка загружает лист."""
+    fetched_at = snapshot_store.read_fetched_at(_spreadsheet.id, worksheet_name)
+    if fetched_at is None:
+        _internal_load_data(_spreadsheet, worksheet_name)
+        fetched_at = snapshot_store.read_fetched_at(_spreadsheet.id, worksheet_name)
+    return fetched_at
+
+@st.cache_resource(ttl=3600, max_entries=8, show_spinner=False)
+def _unread_counters(_spreadsheet, fetched_at):
+    """
+    Счетчики {логин: число непрочитанных} для версии снимка — один groupby вместо скана на каждого пользователя.
+    Объект общий для всех сессий. Статус в листе Notifications меняется только в самой таблице,
+    поэтому счетчик обновляется вместе со снимком («Noted» пишет NotedBy в лист компании и его не трогает).
+    """
+    notifications_df = _load_snapshot_frame(_spreadsheet, NOTIFICATIONS_WORKSHEET, fetched_at)
+    user_column = 'Username' 
+    status_column = 'Status'
+    if user_column not in notifications_df.columns or status_column not in notifications_df.columns:
+        return None
+    is_unread = notifications_df[status_column].str.strip().str.lower() == 'unread'
+    return notifications_df.loc[is_unread, user_column].str.strip().str.lower().value_counts().to_dict()
+
 def get_unread_notifications_count(_spreadsheet, username):
     """Безопасно считает непрочитанные уведомления."""
     if _spreadsheet is None or not username:
         return 0
-    notifications_df = _internal_load_data(_spreadsheet, "Notifications")
-    if notifications_df.empty:
+    fetched_at = _snapshot_version(_spreadsheet, NOTIFICATIONS_WORKSHEET)
+    if fetched_at is None:
         return 0
-    simple_name = username.split('@')[0].lower()
-    user_column = 'Username' 
-    status_column = 'Status'
-    if user_column not in notifications_df.columns or status_column not in notifications_df.columns:
-        st.warning(f"На листе 'Notifications' не найдены колонки '{user_column}' и/или '{status_column}'.")
+    counters = _unread_counters(_spreadsheet, fetched_at)
+    if counters is None:
+        st.warning(f"На листе '{NOTIFICATIONS_WORKSHEET}' не найдены колонки 'Username' и/или 'Status'.")
         return 0
-    user_notifications = notifications_df[
-        (notifications_df[user_column].str.strip().str.lower() == simple_name) & 
-        (notifications_df[status_column].str.strip().str.lower() == 'unread')
-    ]
-    return len(user_notifications)
+    simple_name = username.split('@')[0].lower()
+    return counters.get(simple_name, 0)
+
+# --- Блок 4.1: Очередь записи отметок «Noted» ---
+@st.cache_resource(ttl=3600, max_entries=SNAPSHOT_CACHE_ENTRIES, show_spinner=False)
+def _cached_row_index(_spreadsheet, worksheet_name, fetched_at, id_col):
+    """Индекс ID -> строка листа для конкретной версии снимка."""
+    return SheetRowIndex(_load_snapshot_frame(_spreadsheet, worksheet_name, fetched_at), id_col)
+
+def _sheet_row_index(_spreadsheet, worksheet_name, id_col):
+    """Индекс по текущему снимку листа или None, если снимка нет."""
+    fetched_at = snapshot_store.read_fetched_at(_spreadsheet.id, worksheet_name)
+    if fetched_at is None:
+        return None
+    return _cached_row_index(_spreadsheet, worksheet_name, fetched_at, id_col)
+
+@st.cache_resource(show_spinner=False)
+def get_ack_queue(_spreadsheet):
+    """Общая для процесса очередь записи отметок; после записи обновляется только снимок этого листа."""
+    return AckQueue(
+        _spreadsheet,
+        on_flushed=lambda sheet_name: _refresh_in_background(_spreadsheet, [sheet_name]),
+        row_index=lambda sheet_name, id_col: _sheet_row_index(_spreadsheet, sheet_name, id_col),
+        scheduler=get_quota_scheduler(),
+    )
+
+def queue_notification_ack(sheet_name, record_id, username, id_col, noted_by_col):
+    """Ставит отметку в очередь записи. Возвращает False, если нет подключения к таблице."""
+    spreadsheet = get_spreadsheet()
+    if spreadsheet is None:
+        return False
+    get_ack_queue(spreadsheet).submit(sheet_name, record_id, username, id_col, noted_by_col)
+    return True
+
+def apply_pending_acks(df, sheet_name, id_col, noted_by_col):
+    """Накладывает на таблицу отметки, которые еще не дошли до снимка."""
+    spreadsheet = get_spreadsheet()
+    if spreadsheet is None:
+        return df
+    return get_ack_queue(spreadsheet).apply_overlay(df, sheet_name, id_col, noted_by_col, snapshot_checked_at(df))
+
+# --- Карта имен: логины ищутся в именах продавцов автоматом Ахо–Корасик ---
+@st.cache_data(ttl=3600, max_entries=SNAPSHOT_CACHE_ENTRIES, show_spinner=False)
+def _company_name_matches(_spreadsheet, worksheet_name, fetched_at, sales_col, usernames):
+    """
+    Для одного листа клиентов возвращает [[полное имя, [подходящие логины]], ...] в порядке появления имен.
+    Результат сохраняется рядом со снимком и после перезапуска читается с диска.
+    """
+    signature = {"fetched_at": fetched_at, "sales_col": sales_col, "usernames": list(usernames)}
+    cached = snapshot_store.load_sidecar(_spreadsheet.id, worksheet_name, "names")
+    if cached and all(cached.get(key) == value for key, value in signature.items()):
+        return cached["matches"]
+
+    df_customers = sanitize_columns(_load_snapshot_frame(_spreadsheet, worksheet_name, fetched_at))
+    if df_customers.empty or sales_col not in df_customers.columns:
+        return []
+
+    matcher = LoginMatcher(username.split('@')[0].replace('.', '').replace('-', '') for username in usernames)
+    matches = []
+    for full_name in df_customers[sales_col].dropna().unique():
+        clean_full_name = str(full_name).lower().replace(' ', '').replace('-', '')
+        found = matcher.find(clean_full_name)
+        if found:
+            matches.append([str(full_name).strip(), [usernames[i] for i in found]])
+
+    snapshot_store.save_sidecar(_spreadsheet.id, worksheet_name, "names", {**signature, "matches": matches})
+    return matches
+
+def _assign_names(matches, name_map):
+    """Раздает полные имена логинам: первое найденное имя для логина побеждает, как и раньше."""
+    for full_name, candidate_usernames in matches:
+        for username in candidate_usernames:
+            # Если для этого пользователя уже найдено имя, не перезаписываем его
+            if username in name_map:
+                continue
+            name_map[username] = full_name
+            break # Переходим к следующему полному имени, так как логин уже нашли
+    return name_map
+
+def resolve_display_name(username, company_key=None):
+    """
+    Полное имя одного пользователя для шапки и боковой панели.
+    Листы клиентов читаются по одному и только до первого найденного имени: сначала выбранная
+    компания, затем компании пользователя, затем остальные. Без совпадений — логин с заглавной буквы.
+    """
+    fallback = username.capitalize()
+    try:
+        all_usernames = tuple(st.secrets.get("users", {}).keys())
+        all_customers_configs = st.secrets.get("page_settings", {}).get("customers", {})
+        user_companies = st.secrets.get("users", {}).get(username, {}).get("company")
+    except Exception:
+        return fallback
+    spreadsheet = get_spreadsheet()
+    if spreadsheet is None or not all_customers_configs:
+        return fallback
+
+    user_companies = [user_companies] if isinstance(user_companies, str) else list(user_companies or [])
+    company_order = list(dict.fromkeys([company_key, *user_companies, *all_customers_configs.keys()]))
+    for key in company_order:
+        customers_config = all_customers_configs.get(key) if key else None
+        if not customers_config:
+            continue
+        worksheet_name = customers_config.get("worksheet")
+        sales_col = customers_config.get("sales_col")
+        if not worksheet_name or not sales_col:
+            continue
+        fetched_at = _ensure_snapshots(spreadsheet, [worksheet_name]).get(worksheet_name)
+        if fetched_at is None:
+            continue
+        matches = _company_name_matches(spreadsheet, worksheet_name, fetched_at, sales_col, all_usernames)
+        full_name = _assign_names(matches, {}).get(username)
+        if full_name:
+            return full_name
+    return fallback
 
-# --- ИСПРАВЛЕНИЕ: Полностью переписанная функция для создания карты имен ---
-@st.cache_data(ttl=3600, show_spinner=False)
 def create_username_to_fullname_map():
     """
     Создает словарь для сопоставления логинов с полными именами.
-    Просматривает списки клиентов ВСЕХ компаний для сбора имен.
+    Просматривает списки клиентов ВСЕХ компаний для сбора имен; каждая компания считается
+    один раз на версию своего снимка. Нужен только страницам со списками людей (Team);
+    для имени текущего пользователя есть resolve_display_name.
     """
     name_map = {}
     
     try:
-        all_usernames = st.secrets.get("users", {}).keys()
+        all_usernames = tuple(st.secrets.get("users", {}).keys())
         all_customers_configs = st.secrets.get("page_settings", {}).get("customers", {})
     except Exception:
         return {} # Возвращаем пустую карту, если секреты недоступны
@@ -126,34 +1134,26 @@ def create_username_to_fullname_map():
     if not all_customers_configs:
         return {} # Возвращаем пустую карту, если нет настроек для страницы Customers
 
-    # Проходим по каждой компании, чтобы собрать полные имена
+    spreadsheet = get_spreadsheet()
+    if spreadsheet is None:
+        return {}
+
+    # Листы клиентов всех компаний без снимка забираем одним batch-запросом
+    versions = _ensure_snapshots(spreadsheet, list(dict.fromkeys(
+        config.get("worksheet") for config in all_customers_configs.values()
+        if config.get("worksheet") and config.get("sales_col")
+    )))
+
+    # Проходим по каждой компании: первое найденное имя для логина побеждает, как и раньше
     for company_key, customers_config in all_customers_configs.items():
         worksheet_name = customers_config.get("worksheet")
         sales_col = customers_config.get("sales_col")
 
-        if not worksheet_name or not sales_col:
+        if not worksheet_name or not sales_col or versions.get(worksheet_name) is None:
             continue # Пропускаем компанию, если для нее не настроена страница Customers
 
-        df_customers = _internal_load_data(get_spreadsheet(), worksheet_name)
-
-        if df_customers.empty or sales_col not in df_customers.columns:
-            continue
-
-        unique_full_names = df_customers[sales_col].dropna().unique()
-
-        for full_name in unique_full_names:
-            clean_full_name = str(full_name).lower().replace(' ', '').replace('-', '')
-            
-            # Создаем копию списка логинов, чтобы безопасно итерировать
-            for username in list(all_usernames):
-                # Если для этого пользователя уже найдено имя, не перезаписываем его
-                if username in name_map:
-                    continue
-                
-                simple_username = username.split('@')[0].replace('.', '').replace('-', '')
-                if simple_username in clean_full_name:
-                    name_map[username] = full_name.strip()
-                    break # Переходим к следующему полному имени, так как логин уже нашли
+        matches = _company_name_matches(spreadsheet, worksheet_name, versions[worksheet_name], sales_col, all_usernames)
+        _assign_names(matches, name_map)
                     
     return name_map
 
@@ -0,0 +1,244 @@
+# write_queue.py
+import time
+import logging
+import threading
+
+from gspread.utils import rowcol_to_a1
+
+import metrics
+from quota import QuotaScheduler, WRITE
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждать после первой отметки, чтобы собрать соседние клики в один batch_update
+FLUSH_DELAY = 2.0  # секунд
+MAX_ATTEMPTS = 3
+
+
+def merge_noted_by(current_value, usernames):
+    """Добавляет логины в строку 'NotedBy' (через запятую), не дублируя уже отмеченных."""
+    noted_by_list = [name.strip() for name in (current_value or "").split(',') if name.strip()]
+    for username in usernames:
+        if username not in noted_by_list:
+            noted_by_list.append(username)
+    return ', '.join(noted_by_list)
+
+
+def _column_letter(col_index):
+    """Буква колонки по ее номеру (1 -> 'A')."""
+    return rowcol_to_a1(1, col_index)[:-1]
+
+
+class AckQueue:
+    """
+    Очередь отметок «✅ Noted»: клик только ставит отметку в очередь, а фоновый поток
+    пачкой пишет все накопленные отметки листа одним batch_update.
+    Пока запись не дошла до свежего снимка, отметки накладываются на данные страницы (overlay).
+    """
+
+    def __init__(self, spreadsheet, on_flushed=None, row_index=None, scheduler=None):
+        self._spreadsheet = spreadsheet
+        self._on_flushed = on_flushed
+        # row_index(лист, колонка ID) -> SheetRowIndex по текущему снимку или None
+        self._row_index = row_index
+        # Запросы записи идут через общий бюджет запросов последними по приоритету
+        self._scheduler = scheduler or QuotaScheduler(0)
+        self._worksheets = {}
+        self._cond = threading.Condition()
+        # (лист, колонка ID, колонка NotedBy) -> {ID: {логины}}
+        self._pending = {}
+        self._attempts = {}
+        # (лист, колонка ID, колонка NotedBy) -> время, раньше которого повторную запись не начинаем
+        self._retry_at = {}
+        # (лист, ID) -> {"usernames": {логины}, "flushed_at": время записи или None}
+        self._overlay = {}
+        self._thread = threading.Thread(target=self._run, name="notification-acks", daemon=True)
+        self._thread.start()
+
+    def submit(self, sheet_name, record_id, username, id_col, noted_by_col):
+        """Ставит отметку в очередь и сразу возвращает управление."""
+        record_id = str(record_id).strip()
+        with self._cond:
+            self._pending.setdefault((sheet_name, id_col, noted_by_col), {}).setdefault(record_id, set()).add(username)
+            entry = self._overlay.setdefault((sheet_name, record_id), {"usernames": set(), "flushed_at": None})
+            entry["usernames"].add(username)
+            entry["flushed_at"] = None
+            self._cond.notify()
+        metrics.inc("portal_acks_queued_total", worksheet=sheet_name)
+
+    def pending_count(self):
+        """Сколько отметок еще не записано в Google."""
+        with self._cond:
+            return sum(len(users) for acks in self._pending.values() for users in acks.values())
+
+    def apply_overlay(self, df, sheet_name, id_col, noted_by_col, checked_at=None):
+        """
+        Накладывает на таблицу отметки, которых еще нет в снимке.
+        Отметка считается дошедшей, когда данные сверены с Google позже ее записи
+        (checked_at; по умолчанию — версия снимка в df.attrs["fetched_at"]).
+        """
+        if df.empty or id_col not in df.columns or noted_by_col not in df.columns:
+            return df
+        checked_at = checked_at or df.attrs.get("fetched_at") or 0
+        with self._cond:
+            for key in [key for key, entry in self._overlay.items()
+                        if key[0] == sheet_name and entry["flushed_at"] and entry["flushed_at"] < checked_at]:
+                del self._overlay[key]
+            entries = {key[1]: set(entry["usernames"]) for key, entry in self._overlay.items() if key[0] == sheet_name}
+        if not entries:
+            return df
+
+        ids = df[id_col].astype(str).str.strip()
+        matched = ids[ids.isin(entries)]
+        if matched.empty:
+            return df
+        df = df.copy()
+        for row, record_id in matched.items():
+            df.at[row, noted_by_col] = merge_noted_by(df.at[row, noted_by_col], sorted(entries[record_id]))
+        return df
+
+    def _due_keys(self, now):
+        """Листы с отметками, которые можно писать сейчас (не ждут повтора после ошибки)."""
+        return [key for key in self._pending if self._retry_at.get(key, 0) <= now]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._due_keys(time.time()):
+                    # Ждем новую отметку или срок ближайшего повтора
+                    retry_times = [self._retry_at[key] for key in self._pending if key in self._retry_at]
+                    self._cond.wait(max(0.0, min(retry_times) - time.time()) if retry_times else None)
+            # Даем соседним кликам попасть в ту же пачку
+            time.sleep(FLUSH_DELAY)
+            with self._cond:
+                batch = {key: self._pending.pop(key) for key in self._due_keys(time.time())}
+                for key in batch:
+                    self._retry_at.pop(key, None)
+            for (sheet_name, id_col, noted_by_col), acks in batch.items():
+                try:
+                    self._flush_sheet(sheet_name, id_col, noted_by_col, acks)
+                except Exception as e:
+                    self._retry_later(sheet_name, id_col, noted_by_col, acks, e)
+                    continue
+                self._attempts.pop((sheet_name, id_col, noted_by_col), None)
+                metrics.inc("portal_ack_flushes_total", worksheet=sheet_name)
+                metrics.inc("portal_acks_written_total", len(acks), worksheet=sheet_name)
+                flushed_at = time.time()
+                with self._cond:
+                    still_pending = self._pending.get((sheet_name, id_col, noted_by_col), {})
+                    for record_id in acks:
+                        entry = self._overlay.get((sheet_name, record_id))
+                        # Если за время записи пришли новые клики по этой строке, overlay еще нужен
+                        if entry and record_id not in still_pending:
+                            entry["flushed_at"] = flushed_at
+                if self._on_flushed:
+                    self._on_flushed(sheet_name)
+
+    def _retry_later(self, sheet_name, id_col, noted_by_col, acks, error):
+        key = (sheet_name, id_col, noted_by_col)
+        attempts = self._attempts.get(key, 0) + 1
+        if attempts >= MAX_ATTEMPTS:
+            self._attempts.pop(key, None)
+            logger.error("Отметки для листа '%s' не записаны после %s попыток: %s", sheet_name, attempts, error)
+            with self._cond:
+                for record_id in acks:
+                    self._overlay.pop((sheet_name, record_id), None)
+            return
+        self._attempts[key] = attempts
+        logger.warning("Запись отметок в лист '%s' не удалась (попытка %s), повторим: %s", sheet_name, attempts, error)
+        # Повтор откладывается только для этого листа: отметки других листов пишутся без задержки
+        with self._cond:
+            self._retry_at[key] = time.time() + FLUSH_DELAY * 2 ** attempts
+            pending = self._pending.setdefault(key, {})
+            for record_id, usernames in acks.items():
+                pending.setdefault(record_id, set()).update(usernames)
+            self._cond.notify()
+
+    def _worksheet(self, sheet_name):
+        """Объект листа кэшируется: spreadsheet.worksheet() сам по себе стоит запроса к API."""
+        sheet = self._worksheets.get(sheet_name)
+        if sheet is None:
+            with self._scheduler.request("worksheet", WRITE, worksheet=sheet_name):
+                sheet = self._worksheets[sheet_name] = self._spreadsheet.worksheet(sheet_name)
+        return sheet
+
+    def _flush_sheet(self, sheet_name, id_col, noted_by_col, acks):
+        """Пишет отметки одного листа: сначала по адресам из снимка, иначе — с поиском строк на листе."""
+        sheet = self._worksheet(sheet_name)
+        index = self._row_index(sheet_name, id_col) if self._row_index else None
+        if index is not None and self._flush_by_index(sheet, index, id_col, noted_by_col, acks):
+            return
+        self._flush_by_lookup(sheet, sheet_name, id_col, noted_by_col, acks)
+
+    def _flush_by_index(self, sheet, index, id_col, noted_by_col, acks):
+        """
+        Один batch_get (заголовок + ячейки ID и NotedBy нужных строк) и один batch_update.
+        Если снимок разошелся с листом (строки сдвинулись), возвращает False ничего не записав.
+        """
+        targets = []
+        for record_id in acks:
+            id_cell, noted_by_cell = index.locate(record_id, id_col), index.locate(record_id, noted_by_col)
+            if id_cell is None or noted_by_cell is None:
+                return False
+            targets.append((record_id, id_cell, noted_by_cell))
+
+        ranges = ["1:1"]
+        for _, id_cell, noted_by_cell in targets:
+            ranges += [rowcol_to_a1(*id_cell), rowcol_to_a1(*noted_by_cell)]
+        with self._scheduler.request("batch_get", WRITE, worksheet=sheet.title):
+            values = sheet.batch_get(ranges)
+
+        headers = values[0][0] if values[0] else []
+        id_col_index, noted_by_col_index = index.columns[id_col], index.columns[noted_by_col]
+        if (len(headers) < max(id_col_index, noted_by_col_index)
+                or headers[id_col_index - 1] != id_col or headers[noted_by_col_index - 1] != noted_by_col):
+            return False
+
+        updates = []
+        for i, (record_id, _, noted_by_cell) in enumerate(targets):
+            id_value, noted_by_value = values[1 + 2 * i], values[2 + 2 * i]
+            if not id_value or str(id_value[0][0]).strip() != record_id:
+                return False
+            current_value = noted_by_value[0][0] if noted_by_value and noted_by_value[0] else ""
+            new_value = merge_noted_by(current_value, sorted(acks[record_id]))
+            if new_value != current_value:
+                updates.append({"range": rowcol_to_a1(*noted_by_cell), "values": [[new_value]]})
+        if updates:
+            with self._scheduler.request("batch_update", WRITE, worksheet=sheet.title):
+                sheet.batch_update(updates)
+        return True
+
+    def _flush_by_lookup(self, sheet, sheet_name, id_col, noted_by_col, acks):
+        """Запасной путь: заголовок + две колонки на чтение и один batch_update."""
+        with self._scheduler.request("row_values", WRITE, worksheet=sheet_name):
+            headers = sheet.row_values(1)
+        try:
+            id_col_index = headers.index(id_col) + 1
+            noted_by_col_index = headers.index(noted_by_col) + 1
+        except ValueError:
+            logger.error("На листе '%s' нет колонок '%s' и/или '%s'.", sheet_name, id_col, noted_by_col)
+            return
+
+        id_letter, noted_by_letter = _column_letter(id_col_index), _column_letter(noted_by_col_index)
+        with self._scheduler.request("batch_get", WRITE, worksheet=sheet_name):
+            id_values, noted_by_values = sheet.batch_get([f"{id_letter}:{id_letter}", f"{noted_by_letter}:{noted_by_letter}"])
+
+        rows_by_id = {}
+        for row_number, cells in enumerate(id_values, start=1):
+            if row_number > 1 and cells:
+                rows_by_id.setdefault(str(cells[0]).strip(), row_number)
+
+        updates = []
+        for record_id, usernames in acks.items():
+            row_number = rows_by_id.get(record_id)
+            if row_number is None:
+                logger.warning("Уведомление '%s' не найдено на листе '%s'.", record_id, sheet_name)
+                continue
+            cells = noted_by_values[row_number - 1] if row_number <= len(noted_by_values) else []
+            current_value = cells[0] if cells else ""
+            new_value = merge_noted_by(current_value, sorted(usernames))
+            if new_value != current_value:
+                updates.append({"range": rowcol_to_a1(row_number, noted_by_col_index), "values": [[new_value]]})
+        if updates:
+            with self._scheduler.request("batch_update", WRITE, worksheet=sheet_name):
+                sheet.batch_update(updates)